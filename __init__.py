@@ -1,28 +1,45 @@
 #!/usr/bin/env python
-import os, tempfile
+import os, itertools, time, functools
 import numpy as np
-from scipy.constants import pi, c, epsilon_0, mu_0
+# matplotlib, scipy, CSXCAD and openEMS are imported when first needed
+# to keep "import openems" fast for geometry, KiCad and sweep workers
+pi = np.pi
+c = 299792458.0
+mu_0 = 1.25663706212e-6 # CODATA 2018
+epsilon_0 = 1.0 / (mu_0 * c * c)
 mm = 0.001
-import matplotlib.pyplot
 import openems.kicadfpwriter
-
-from CSXCAD  import ContinuousStructure
-from openEMS import openEMS
+from .cache import Cache, scene_hash
+from .mesher import AutoMesh, merge_lines
+from .report import MeshReport, mesh_report
+from .decay import DecayExtrapolation
+from .touchstone import write_touchstone
+from .parallel import fork_map
+from .plot import plot_s, defer as defer_plot
+from . import probes, spectrum, adaptive, estimate, calibrate, profiling, backend
+from . import symmetry
 
 np.set_printoptions(precision=8)
 
 # convert an array of complex numbers to an array of [x,y]
+# a view of the real and imaginary parts, no copy if a is a contiguous complex array
 def complex_to_xy(a):
-    rv = np.zeros((len(a),2))
-    for i in range(len(a)):
-        rv[i][0] = a[i].real
-        rv[i][1] = a[i].imag
+    return np.ascontiguousarray(a, dtype=complex).view(float).reshape(-1, 2)
+
+# read only [x,y] of an arc centered on 0, the most recent are kept
+@functools.lru_cache(maxsize=1024)
+def _arc(r, a0, a1, npoints):
+    rv = complex_to_xy(r*np.exp(1j*np.linspace(a0,a1,npoints)))
+    rv.flags.writeable = False
     return rv
 
 # generate an array of [x,y] for an arc
 def arc(x, y, r, a0, a1, npoints=32):
-    angles = np.linspace(a0,a1,npoints)
-    return complex_to_xy(r*np.exp(1j*angles) + x + 1j*y)
+    try:
+        xy = _arc(r, a0, a1, npoints)
+    except TypeError: # unhashable arguments such as 0-d arrays
+        xy = _arc.__wrapped__(r, a0, a1, npoints)
+    return xy + [x, y]
 
 def mirror(point, axes):
     retval = np.array(point).copy()
@@ -40,25 +57,28 @@ def db_angle(s):
     return "{:>12f} {:>12f}".format(logmag, angle)
 
 def save_s1p(f, s11, filename, z):
-    fdata = "# GHz S DB R {}\n".format(z)
-    for i in range(len(f)):
-        fdata += "{0:>12f} {1}\n".format(f[i]/1e9, db_angle(s11[i]))
-    with open(filename, "w") as f:
-        f.write(fdata)
+    write_touchstone(filename, f, s11, z)
 
 def save_s2p_symmetric(f, s11, s21, filename, z):
     print("warning: save_s2p_symmetric is only valid for a symmetric 2 port")
-    fdata = "# GHz S DB R {}\n".format(z)
-    for i in range(len(f)):
-        fdata += "{0:>12f} {1} {2} {2} {1}\n".format(f[i]/1e9, db_angle(s11[i]), db_angle(s21[i]))
-    with open(filename, "w") as f:
-        f.write(fdata)
+    s = np.array([[s11, s21], [s21, s11]]).transpose(2, 0, 1)
+    write_touchstone(filename, f, s, z)
+
+def save_snp(f, s, filename, z):
+    """ s[f, i, j] = full N port S matrix, see touchstone.write_touchstone() """
+    write_touchstone(filename, f, s, z)
 
 class Material():
     def __init__(self, em, name):
         self.lossy = False
         self.em = em
         self.name = name
+    @property
+    def material(self):
+        """ the CSXCAD property, added to em.CSX when first used """
+        if getattr(self, '_material', None) is None:
+            self._material = self.add_property(self.em.CSX)
+        return self._material
     def AddBox(self, start, stop, priority, **kwargs):
         return Box(self, start=start, stop=stop, priority=priority, **kwargs)
     def AddPolygon(self, **kwargs):
@@ -70,7 +90,6 @@ class Dielectric(Material):
     def __init__(self, em, name, eps_r=1.0, kappa = 0, ur=1.0, tand=0.0, fc = 0):
         if tand > 0.0:
             kappa = tand * 2*pi*fc * epsilon_0 * eps_r
-        self.material = em.CSX.AddMaterial(name, epsilon = eps_r, kappa = kappa, mue = ur)
         self.em = em
         self.name = name
         self.eps_r = eps_r
@@ -79,6 +98,8 @@ class Dielectric(Material):
         self.type = 'dielectric'
         self.lossy = False # metal loss
         # magnetic loss
+    def add_property(self, CSX):
+        return CSX.AddMaterial(self.name, epsilon = self.eps_r, kappa = self.kappa, mue = self.ur)
 
 class LumpedElement(Material):
     """ element_type = 'R' or 'C' or 'L' """
@@ -88,7 +109,8 @@ class LumpedElement(Material):
         self.element_type = element_type
         self.value = value
         self.direction = direction
-        self.material = em.CSX.AddLumpedElement(name=self.name, caps=False, ny = self.direction, R=self.value)
+    def add_property(self, CSX):
+        return CSX.AddLumpedElement(name=self.name, caps=False, ny = self.direction, R=self.value)
 
 class Metal(Material):
     def __init__(self, em, name):
@@ -96,7 +118,8 @@ class Metal(Material):
         self.em = em
         self.name = name
         self.type = 'metal'
-        self.material=em.CSX.AddMetal(name)
+    def add_property(self, CSX):
+        return CSX.AddMetal(self.name)
 
 class LossyMetal(Material):
     def __init__(self, em, name, conductivity=56e6, frequency=None, thickness=None, ur=1.0):
@@ -111,11 +134,32 @@ class LossyMetal(Material):
         self.name = name
         self.type = 'metal'
         self.lossy = True
-        self.material = em.CSX.AddConductingSheet(name, conductivity=self.conductivity, thickness=self.thickness)
+    def add_property(self, CSX):
+        return CSX.AddConductingSheet(self.name, conductivity=self.conductivity, thickness=self.thickness)
+
+def box_edges(start, stop, sided=True):
+    """
+    mesh edges [(axis, coordinate, side)] of an axis aligned box
+    side is +1 when the object is on the greater side of the coordinate,
+    -1 when on the lesser side, 0 if not known, None for a vertex the mesh
+    need not resolve (see Polygon.edges())
+    """
+    edges = []
+    for axis in range(3):
+        lo, hi = sorted([start[axis], stop[axis]])
+        edges += [(axis, lo, 1 if sided else 0), (axis, hi, -1 if sided else 0)]
+    return edges
+
+def round_edges(x, y, z, r):
+    """ mesh edges for a z directed cylinder, z = [start, stop] """
+    return box_edges([x-r, y-r, z[0]], [x+r, y+r, z[1]], sided=False)
 
 class Object():
     def generate_kicad(self, g):
         pass
+    def edges(self):
+        """ see box_edges() """
+        return []
 
 from .polygon import Polygon
 
@@ -151,6 +195,8 @@ class Box(Object):
                   y = 500.0 * (self.start[1] + self.stop[1]), # mm
                   xsize = 1000.0 * abs(self.start[0] - self.stop[0]), # mm
                   ysize = 1000.0 * abs(self.start[1] - self.stop[1]))
+    def edges(self):
+        return box_edges(self.start, self.stop)
     def generate_octave(self):
         self.material.material.AddBox(start=self.start, stop=self.stop,
                                       priority=self.priority)
@@ -171,6 +217,11 @@ class Cylinder(Object):
         self.padname = '1'
         self.priority = priority
         self.em.objects[self.name] = self
+    def edges(self):
+        axis = np.argmax(np.abs(self.stop - self.start))
+        r = np.array([0 if i == axis else self.radius for i in range(3)])
+        return box_edges(np.minimum(self.start, self.stop) - r,
+                         np.maximum(self.start, self.stop) + r, sided=False)
     def generate_octave(self):
         self.material.material.AddCylinder(priority=self.priority,
                                            start=self.start,
@@ -210,6 +261,12 @@ class Via(Object):
                   drill = self.drillradius * 2000.0,
                   shape = "circle",
                   name = self.padname)
+    def edges(self):
+        edges = round_edges(self.x + self.em.via_offset_x, self.y + self.em.via_offset_y, self.z[0],
+                            self.drillradius + self.wall_thickness)
+        for z in self.z[1:]:
+            edges += round_edges(self.x, self.y, z, self.padradius)
+        return edges
     def generate_octave(self):
         start = [self.x + self.em.via_offset_x, self.y + self.em.via_offset_y, self.z[0][0]]
         stop = [self.x + self.em.via_offset_x, self.y + self.em.via_offset_y, self.z[0][1]]
@@ -249,6 +306,8 @@ class RoundPad(Object):
                   mask_clearance = 0.0,
                   shape = "circle",
                   name = self.padname)
+    def edges(self):
+        return round_edges(self.x, self.y, self.z, self.padradius)
     def generate_octave(self):
         self.material.material.AddCylinder(start = [self.x, self.y, self.z[0]],
                                            stop = [self.x, self.y, self.z[1]],
@@ -307,9 +366,11 @@ class Port(Object):
         self.padname = padname
         self.layer = layer
         self.portnumber = len(em.ports)
-        name = "p" + str(self.portnumber)
-        em.objects[name] = self
+        self.name = "p" + str(self.portnumber)
+        em.objects[self.name] = self
         em.ports.append(self)
+    def edges(self):
+        return box_edges(self.start, self.stop, sided=False)
     def generate_octave(self):
         self.port = self.em.FDTD.AddLumpedPort(
             self.portnumber,
@@ -336,13 +397,13 @@ class OpenEMS:
                  boundaries = ['PEC', 'PEC', 'PEC', 'PEC', 'PEC', 'PEC'],
                  fsteps = 1601
     ):
-        self.FDTD = openEMS(NrTS=NrTS, EndCriteria=EndCriteria)
-        self.FDTD.SetGaussExcite((fmin+fmax)/2.0, (fmax-fmin)/2.0)
-        self.FDTD.SetBoundaryCond(boundaries)
-        self.CSX = ContinuousStructure()
-        self.FDTD.SetCSX(self.CSX)
-        self.mesh = self.CSX.GetGrid()
-        self.mesh.SetDeltaUnit(1.0) # specify everything in m
+        self.NrTS = NrTS
+        self.EndCriteria = EndCriteria
+        self.boundaries = boundaries
+        self.backend = backend.current() # where CSX and FDTD come from, see backend.py
+        self._FDTD = None # see the FDTD, CSX and mesh properties
+        self._CSX = None
+        self._mesh = None
         self.fmin = fmin
         self.fmax = fmax
         self.fsteps = fsteps
@@ -356,9 +417,55 @@ class OpenEMS:
         self.xgrid = None # for plot
         self.ygrid = None
         self.legend_location = 2 # upper left
+        self.plot_formats = ['png', 'svg', 'pdf'] # [] to save no plots
+        self.defer_plot = False # render plots in a low priority process after returning
+        self.plot_process = None # that process, if any
         self.options = ''
         self.name_count = 0
-        self.resolution = 0.0001
+        self.resolution = 0.0001 # or 'auto' to use self.mesher
+        self.mesher = None # default AutoMesh() for resolution = 'auto'
+        self.mesh_tolerance = 1e-6 # merge mesh lines closer than this before smoothing
+        self.merged_lines = {'x': 0, 'y': 0, 'z': 0} # lines removed by the merge
+        self.generated = None # generation() of the CSX once generated
+        self.symmetry = '' # mirror planes to reduce the domain, see solve_symmetric()
+        self.reduced = '' # the planes being solved as walls in this process
+        self.port_symmetry = 'auto' # mirrors from the geometry, or [[port permutation], ...]
+        self.reciprocal = True # s[i, j] = s[j, i], no ferrites or other nonreciprocal media
+        self.simpath = None # default is /tmp/openems_data<name>
+        self.cache = Cache() # set to None to always solve, limited to Cache.max_bytes
+        self.keep_probes = True # keep the port probes as binary arrays after each solve, see probes.py
+        self.fast_dft = True # port spectra by chirp-z rather than a DFT per frequency, see spectrum.py
+        self.memory_budget = 'auto' # bytes for the solves running at once, 'auto' for the available RAM
+        self.time_budget = None # seconds per solve
+        self.cells_per_second = None # solver speed, default from the host profile, see calibrate.py
+        self.concurrent = 1 # solves running at once, for the memory budget
+        self.profile = profiling.Profile() # phases of the current run
+        self.profile_path = None # append a JSON record of the phases of each run_openems
+        self.profile_hook = None # called with that record
+        self.early_stop = None # DecayExtrapolation() to stop high Q solves early
+
+    @property
+    def CSX(self):
+        if self._CSX is None:
+            self._CSX = self.backend.structure()
+        return self._CSX
+
+    @property
+    def mesh(self):
+        if self._mesh is None:
+            self._mesh = self.CSX.GetGrid()
+            self._mesh.SetDeltaUnit(1.0) # specify everything in m
+        return self._mesh
+
+    @property
+    def FDTD(self):
+        """ created on first use, so fmin, fmax and boundaries may be set until then """
+        if self._FDTD is None:
+            self._FDTD = self.backend.solver(NrTS=self.NrTS, EndCriteria=self.EndCriteria)
+            self._FDTD.SetGaussExcite((self.fmin+self.fmax)/2.0, (self.fmax-self.fmin)/2.0)
+            self._FDTD.SetBoundaryCond(self.boundaries)
+            self._FDTD.SetCSX(self.CSX)
+        return self._FDTD
 
     def AddPort(self, start, stop, direction, z):
         return Port(self, start, stop, direction, z)
@@ -369,25 +476,60 @@ class OpenEMS:
         self.name_count += 1
         return "pad_{}".format(self.name_count)
 
-    def write_kicad(self, fpname, mirror=""):
-        g = kicadfpwriter.Generator(fpname)
-        g.mirror = mirror
-        for object in self.objects:
-            g.drill = 0
-            self.objects[object].generate_kicad(g)
-        fp = g.finish()
-        with open(self.name+".kicad_mod", "w") as f:
-            f.write(fp)
-
-    def run_openems(self, options='view solve', z=50, initialize=True, show_plot=True, numThreads=8):
-        cwd = os.getcwd()
-        basename = cwd + '/' + self.name
-        simpath = r'/tmp/openems_data' + self.name.split("/")[-1]
-        if not os.path.exists(simpath):
-            os.mkdir(simpath)
-
-        for object in self.objects:
-            self.objects[object].generate_octave()
+    def write_kicad(self, fpname, mirror="", filename=None):
+        """ footprint fpname written to filename, default self.name + ".kicad_mod" """
+        kicadfpwriter.write(self.objects.values(), [(filename or self.name + ".kicad_mod", fpname, mirror)])
+
+    def get_simpath(self):
+        if self.simpath:
+            return self.simpath
+        return r'/tmp/openems_data' + self.name.split("/")[-1]
+
+    def generation(self):
+        """ what the CSX is generated for besides the objects: the excited port and symmetry walls """
+        return (self.excitation_port, self.reduced, [str(bc) for bc in self.boundaries])
+
+    def generate(self):
+        """
+        add the objects and mesh lines to the CSX structure, only once per
+        process: raises if it was generated for another generation()
+        """
+        if self.generated:
+            if self.generated != self.generation():
+                raise Exception("{} was generated for (excitation, planes, boundaries) {}, not {}: "
+                                "use a new OpenEMS instance".format(self.name, self.generated, self.generation()))
+            return
+        self.generated = self.generation()
+        user_lines = {d: self.mesh.GetLines(d) for d in 'xyz'}
+        with self.profile.phase('generate_octave', objects=len(self.objects)) as record:
+            types = record['types'] = {}
+            for object in self.objects:
+                start = time.perf_counter()
+                self.objects[object].generate_octave()
+                t = types.setdefault(type(self.objects[object]).__name__, [0, 0.0])
+                t[0] += 1
+                t[1] += time.perf_counter() - start
+
+        with self.profile.phase('mesh', resolution=str(self.resolution)):
+            self.generate_mesh(user_lines)
+
+    def generate_mesh(self, user_lines):
+        if self.mesh_tolerance:
+            # lines added directly are kept in preference to object vertices
+            for d in 'xyz':
+                lines, removed = merge_lines(self.mesh.GetLines(d), self.mesh_tolerance, user_lines[d])
+                self.merged_lines[d] = removed
+                if removed:
+                    print("mesh {}: merged {} lines within {} m".format(d, removed, self.mesh_tolerance))
+                self.mesh.SetLines(d, lines)
+
+        self.clip_reduced()
+        if isinstance(self.resolution, str): # 'auto'
+            if self.mesher is None:
+                self.mesher = AutoMesh()
+            self.mesher.apply(self)
+            self.clip_reduced()
+            return
 
         import collections.abc
         if not isinstance(self.resolution, collections.abc.Sequence):
@@ -397,52 +539,315 @@ class OpenEMS:
         for i in range(3):
             if self.resolution[i] is not None:
                 self.mesh.SmoothMeshLines('xyz'[i], self.resolution[i], ratio)
+        self.clip_reduced()
+
+    def clip_reduced(self):
+        """ limit the mesh to the positive side of the symmetry planes being solved """
+        for plane in self.reduced:
+            self.mesh.SetLines(plane, symmetry.clip_half(self.mesh.GetLines(plane, do_sort=True)))
+
+    def cells(self):
+        """ total cells of the generated mesh """
+        return int(np.prod([max(0, len(self.mesh.GetLines(d, do_sort=True)) - 1) for d in 'xyz']))
+
+    def mesh_report(self, nsmallest=5):
+        """
+        MeshReport of the cell counts, timestep and smallest cells, generated
+        in a forked process unless already generated here, so this instance
+        can still be solved for any excitation
+        """
+        def report(n):
+            self.generate()
+            return mesh_report(self, n)
+        return report(nsmallest) if self.generated else fork_map(report, [nsmallest], 1)[0]
+
+    def check_ungenerated(self, method):
+        """ raise if generated here, the forked solves of method must generate their own excitations """
+        if self.generated:
+            raise Exception("{}() needs an OpenEMS instance not yet generated, {} was generated for "
+                            "(excitation, planes, boundaries) {}".format(method, self.name, self.generated))
+
+    def view(self, simpath):
+        self.generate()
+        CSX_file = simpath + '/csx.xml'
+        with self.profile.phase('write_xml'):
+            self.CSX.Write2XML(CSX_file)
+        os.system(r'AppCSXCAD "{}"'.format(CSX_file))
+
+    def solve_excitation(self, port, simpath, f, z, numThreads, postprocess=False):
+        """
+        solve with only self.ports[port] excited, returns s[f, i] for that column
+        postprocess: don't run the solver, use the probes of an earlier solve in simpath
+        numThreads: None for the fastest for this mesh on this host, see calibrate.py
+        """
+        self.excitation_port = self.ports[port].portnumber if self.ports else port
+        self.generate()
+        if numThreads is None:
+            numThreads = calibrate.best_threads(self.cells())[0]
+        key = None
+        if self.cache and self.ports:
+            key = self.scene_hash(f, z)
+            cached = self.cache.load(key)
+            if cached is not None:
+                print("using cached result", key)
+                return cached['s']
+        if postprocess:
+            probes.check(simpath, self.scene_hash())
+        else:
+            if self.memory_budget or self.time_budget:
+                estimate.admit(self, self.concurrent)
+            with self.profile.phase('run', port=self.excitation_port, threads=numThreads) as record:
+                if self.early_stop and self.ports:
+                    # end of the gaussian excitation
+                    tstart = 9.0 / (pi * 0.5 * (self.fmax - self.fmin))
+                    monitor = self.early_stop.start(simpath, self.fmax, tstart)
+                    try:
+                        self.run_fdtd(simpath, numThreads, record)
+                    finally:
+                        stopped = self.early_stop.stop(monitor, simpath)
+                    self.early_stop.finish(simpath, self.fmax, tstart, self.EndCriteria, stopped)
+                else:
+                    self.run_fdtd(simpath, numThreads, record)
+        if not self.ports:
+            return np.zeros((len(f), 0), dtype=complex)
+        if self.keep_probes and not postprocess:
+            # before the port spectra, so each text probe is parsed once and they read the memory maps
+            scene = self.scene_hash()
+            with self.profile.phase('archive_probes'):
+                probes.archive(simpath, scene)
+        if not (self.fast_dft and spectrum.calc_ports([p.port for p in self.ports], simpath, f, z, self.profile)):
+            # the engine's CalcPort reads text files
+            reads_archive = all(getattr(p.port, 'reads_archive', False) for p in self.ports)
+            restored = probes.restore(simpath) if probes.header(simpath) and not reads_archive else []
+            for (i, p) in enumerate(self.ports):
+                with self.profile.phase('calc_port', port=i, frequencies=len(f)):
+                    p.port.CalcPort(simpath, f, ref_impedance = z)
+            for fn in restored:
+                os.remove(fn)
+        uf_inc = self.ports[port].port.uf_inc
+        s = np.array([p.port.uf_ref / uf_inc for p in self.ports]).T
+        if key:
+            self.cache.store(key, f=f, s=s,
+                             uf_inc=np.array([p.port.uf_inc for p in self.ports]),
+                             uf_ref=np.array([p.port.uf_ref for p in self.ports]))
+        return s
+
+    def run_fdtd(self, simpath, numThreads, record):
+        """ FDTD.Run, adding the timesteps and speed openEMS reports to record when profiling """
+        if not (self.profile_path or self.profile_hook):
+            self.FDTD.Run(simpath, verbose=3, cleanup=True, numThreads=numThreads)
+            return
+        with profiling.Tee() as tee:
+            self.FDTD.Run(simpath, verbose=3, cleanup=True, numThreads=numThreads)
+        record.update(profiling.parse_engine(tee.text))
+
+    def scene_hash(self, *extra):
+        """ see cache.scene_hash(), timed as its own phase, which includes an XML write to hash """
+        with self.profile.phase('scene_hash'):
+            return scene_hash(self, *extra)
+
+    def forked(self, solve, jobs, nprocesses, labels):
+        """
+        fork_map(solve, jobs, nprocesses) keeping the profile phases of each
+        job, tagged with labels[i]
+        """
+        def job(j):
+            self.profile = profiling.Profile()
+            return solve(j), self.profile.phases
+        results = fork_map(job, jobs, nprocesses)
+        for (label, (column, phases)) in zip(labels, results):
+            self.profile.extend(phases, excitation=label)
+        return [column for (column, phases) in results]
+
+    def solve_all_ports(self, f, z=50, nprocesses=None, numThreads=None, postprocess=False):
+        """
+        Run one solve per excited port, concurrently in forked processes
+        each with its own sim path and a share of numThreads (default all cores).
+        Only the ports from excitation_plan() are excited, the rest of the
+        matrix follows from the port symmetries and reciprocity.
+        returns the full S matrix, s[f, i, j]
+        """
+        self.check_ungenerated('solve_all_ports')
+        nports = len(self.ports)
+        perms, excite = self.excitation_plan()
+        if len(excite) < nports:
+            print("exciting ports {} of {}, the rest by symmetry".format(excite, nports))
+        if numThreads is None:
+            numThreads = os.cpu_count() or 1
+        if nprocesses is None:
+            nprocesses = max(1, min(len(excite), numThreads))
+        threads = max(1, numThreads // nprocesses)
+        jobs = [(j, self.get_simpath() + '_{}'.format(j), f, z, threads, postprocess) for j in excite]
+        budget = estimate.memory_budget(self) # before any of the solves holds memory
+        def solve(job):
+            self.concurrent *= nprocesses
+            self.memory_budget = budget
+            return self.solve_excitation(*job)
+        columns = self.forked(solve, jobs, nprocesses, excite)
+        return symmetry.fill(dict(zip(excite, columns)), perms, nports, self.reciprocal)
+
+    def excitation_plan(self):
+        """
+        returns (port permutations, the fewest ports to excite) from
+        self.port_symmetry and self.reciprocal, see symmetry.plan()
+        """
+        perms = symmetry.permutations(self, self.port_symmetry)
+        return perms, symmetry.plan(perms, len(self.ports), self.reciprocal)
+
+    def solve_symmetric(self, f, z=50, nprocesses=None, numThreads=None, postprocess=False):
+        """
+        Solve only the positive side of the symmetry planes in self.symmetry
+        ('x' is the plane x = 0, 'y', 'xy' or 'auto' to detect them) once with a
+        PMC and once with a PEC wall on each plane, exciting each port on that
+        side, then reconstruct the full s[f, i, j]. Every port must have a mirror
+        image and none may cross a plane.
+        """
+        self.check_ungenerated('solve_symmetric')
+        planes = symmetry.detect(self) if self.symmetry == 'auto' else self.symmetry
+        if not planes:
+            return self.solve_all_ports(f, z, nprocesses, numThreads, postprocess)
+        reps, images = symmetry.port_orbits(self, planes)
+        modes = list(itertools.product([1, -1], repeat=len(planes)))
+        jobs = [(mode, j) for mode in modes for j in range(len(reps))]
+        if numThreads is None:
+            numThreads = os.cpu_count() or 1
+        if nprocesses is None:
+            nprocesses = max(1, min(len(jobs), numThreads))
+        threads = max(1, numThreads // nprocesses)
+        budget = estimate.memory_budget(self)
+        def solve(job):
+            mode, j = job
+            self.concurrent *= nprocesses
+            self.memory_budget = budget
+            self.reduced = planes
+            self.boundaries = symmetry.boundaries(self, planes, mode)
+            for p in self.ports:
+                if p not in reps:
+                    del self.objects[p.name]
+            self.ports = reps
+            self.FDTD.SetBoundaryCond(self.boundaries)
+            simpath = self.get_simpath() + '_{}{}'.format(''.join('e' if chi > 0 else 'o' for chi in mode), j)
+            return self.solve_excitation(j, simpath, f, z, threads, postprocess)
+        columns = self.forked(solve, jobs, nprocesses, [str(job) for job in jobs])
+        s = {}
+        for mode in modes:
+            s[mode] = np.stack([c for (job, c) in zip(jobs, columns) if job[0] == mode], axis=2)
+        return symmetry.reconstruct(planes, modes, s, images, len(self.ports))
+
+    def solve_adaptive(self, z=50, tol=1e-3, numThreads=None, postprocess=False, **kwargs):
+        """
+        Solve the full S matrix once (or reuse the probes of the last solve)
+        and sample it adaptively from fmin to fmax by post-processing, see
+        adaptive.sample() for tol and kwargs.
+        returns (adaptive.RationalModel of s[f, i, j], f, s) with the samples it was fitted to
+        """
+        solve = self.solve_symmetric if self.symmetry else self.solve_all_ports
+        cache = self.cache
+        def response(f):
+            nonlocal postprocess
+            s = solve(f, z=z, numThreads=numThreads, postprocess=postprocess)
+            postprocess = True
+            self.cache = None # the refinements post-process the same probes, not worth an entry each
+            return s
+        try:
+            return adaptive.sample(response, self.fmin, self.fmax, tol, **kwargs)
+        finally:
+            self.cache = cache
+
+    def record_profile(self, **info):
+        """
+        the JSON record of the phases of this run, appended as a line to
+        self.profile_path and passed to self.profile_hook if either is set
+        """
+        if not (self.profile_path or self.profile_hook):
+            return None
+        record = self.profile.record(self.name, **info)
+        if self.profile_path:
+            profiling.write(record, self.profile_path)
+        if self.profile_hook:
+            self.profile_hook(record)
+        return record
+
+    def plot(self, f, s, basename, show_plot=True):
+        """ s = list of s[i1], saved as basename.<format> for each of self.plot_formats """
+        plot_s(f, s, basename, self.plot_formats, self.xgrid, self.ygrid,
+               self.legend_location, show_plot)
+
+    def run_openems(self, options='view solve', z=50, initialize=True, show_plot=True, numThreads=None,
+                    all_ports=False):
+        """
+        options: 'view' to show the structure, 'solve' to run the solver,
+        'report' to print and return the mesh report only, without viewing or solving
+        'postprocess' to recompute the results from the probes of the last solve,
+        for a new frequency list (fmin, fmax, fsteps) or reference impedance z
+        all_ports: excite each port in turn (in parallel) and return the full s[f, i, j]
+        rather than the list of s[i1], numThreads is then the total for all solves
+        with self.symmetry set the full matrix is always solved, see solve_symmetric()
+        otherwise only port 0 is excited and a multiport is saved as a symmetric
+        2 port unless excitation_plan() shows port 0 determines the whole matrix
+        plots are saved in each of self.plot_formats, by a separate low priority
+        process after returning if self.defer_plot
+        the time and memory of each phase are recorded, see record_profile()
+        """
+        self.profile = profiling.Profile()
+        cwd = os.getcwd()
+        basename = cwd + '/' + self.name
+        simpath = self.get_simpath()
+        if not os.path.exists(simpath):
+            os.mkdir(simpath)
 
+        if 'report' in options: # dry run, never starts the solver
+            def dry_run(nothing):
+                self.generate()
+                return self.mesh_report(), estimate.estimate(self)
+            # in a fork unless generated, so this instance can still be solved
+            report, e = dry_run(None) if self.generated else fork_map(dry_run, [None], 1)[0]
+            print(report)
+            print(e)
+            return report
         if 'view' in options:
-                CSX_file = simpath + '/csx.xml'
-                self.CSX.Write2XML(CSX_file)
-                os.system(r'AppCSXCAD "{}"'.format(CSX_file))
-        if 'solve' in options:
-            self.FDTD.Run(simpath, verbose=3, cleanup=True, numThreads=numThreads)
+            if all_ports or self.symmetry: # keep this process free of geometry for the forked solvers
+                self.forked(self.view, [simpath], 1, ['view'])
+            else:
+                self.view(simpath)
+        if 'solve' in options or 'postprocess' in options:
+            postprocess = 'solve' not in options
             f = np.linspace(self.fmin, self.fmax, self.fsteps)
-            for p in self.ports:
-                p.port.CalcPort(simpath, f, ref_impedance = z)
             nports = len(self.ports)
-
-            s = []
-
-            for p in range(nports):
-                s.append(self.ports[p].port.uf_ref / self.ports[0].port.uf_inc)
-
-            if nports < 1:
-                return
+            sm = None
+            if all_ports or self.symmetry:
+                if nports < 1:
+                    return
+                if self.symmetry:
+                    sm = self.solve_symmetric(f, z=z, numThreads=numThreads, postprocess=postprocess)
+                else:
+                    sm = self.solve_all_ports(f, z=z, numThreads=numThreads, postprocess=postprocess)
+                s = [sm[:,i,0] for i in range(nports)]
+            else:
+                sc = self.solve_excitation(0, simpath, f, z, numThreads, postprocess)
+                s = [sc[:,i] for i in range(nports)]
+                if nports < 1:
+                    return
+                if nports > 1:
+                    perms, excite = self.excitation_plan()
+                    if excite == [0]: # port 0 alone determines the matrix
+                        sm = symmetry.fill({0: sc}, perms, nports, self.reciprocal)
 
             self.frequencies = f
-            fig, ax = matplotlib.pyplot.subplots()
-            s11 = s[0]
-            if nports == 1:
-                save_s1p(f, s11, basename+".s1p", z=z)
-            if nports > 1:
-                s21 = s[1]
-                ax.plot(f/1e9, 20*np.log10(np.abs(s21)), label = 'dB(s21)')
-                save_s2p_symmetric(f, s11, s21, basename+".s2p", z=z)
-            ax.plot(f/1e9, 20*np.log10(np.abs(s11)), label = 'dB(s11)')
-            if nports > 2:
-                for i in range(2,nports):
-                    ax.plot(f/1e9, 20*np.log10(np.abs(s[i])), label = f'dB(s{i+1}1)')
-
-            ax.set_xlabel('Frequency (GHz)')
-            ax.set_ylabel('dB')
-            if hasattr(self.xgrid, "__len__"):
-                ax.set_xticks(self.xgrid)
-            if hasattr(self.ygrid, "__len__"):
-                ax.set_yticks(self.ygrid)
-            ax.grid(True)
-            fig.tight_layout()
-            ax.legend(loc=self.legend_location)
-            matplotlib.pyplot.savefig(basename+".png")
-            matplotlib.pyplot.savefig(basename+".svg")
-            matplotlib.pyplot.savefig(basename+".pdf")
-            if show_plot:
-                matplotlib.pyplot.show()
+            with self.profile.phase('touchstone', ports=nports, frequencies=len(f)):
+                if sm is not None:
+                    save_snp(f, sm, basename+".s{}p".format(nports), z=z)
+                elif nports == 1:
+                    save_s1p(f, s[0], basename+".s1p", z=z)
+                elif nports > 1:
+                    save_s2p_symmetric(f, s[0], s[1], basename+".s2p", z=z)
+            with self.profile.phase('plot', deferred=bool(self.defer_plot)):
+                if self.defer_plot and self.plot_formats:
+                    self.plot_process = defer_plot(f, s, basename, self.plot_formats, self.xgrid,
+                                                   self.ygrid, self.legend_location)
+                elif self.plot_formats or show_plot:
+                    self.plot(f, s, basename, show_plot)
+            self.record_profile(options=options, ports=nports, frequencies=len(f), all_ports=all_ports)
+            if all_ports:
+                return sm
             return s
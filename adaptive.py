@@ -0,0 +1,146 @@
+"""
+adaptive frequency sampling with a rational (vector fitted) model:
+fit() fits stable common poles to sampled responses, sample() adds
+points where the model is uncertain until it is within tol
+"""
+import numpy as np
+from openems.touchstone import write_touchstone
+
+def basis(s, poles):
+    """
+    real basis functions at s: 1/(s-a) for a real pole a, and
+    1/(s-a) + 1/(s-a*), j/(s-a) - j/(s-a*) for a complex pair a, a*
+    poles: real poles and one of each pair with imag > 0
+    """
+    cols = []
+    for a in poles:
+        if a.imag == 0:
+            cols.append(1/(s - a))
+        else:
+            cols.append(1/(s - a) + 1/(s - a.conjugate()))
+            cols.append(1j/(s - a) - 1j/(s - a.conjugate()))
+    return np.array(cols).T.reshape(len(s), -1)
+
+def realify(A):
+    """ complex equations as real ones """
+    return np.concatenate([A.real, A.imag])
+
+def relocate(s, h, poles):
+    """
+    one vector fitting iteration, h[f, k]: the zeros of the weight
+    sigma(s) = 1 + sum c phi(s) fitted so that sigma h is rational with poles,
+    unstable ones reflected into the left half plane
+    """
+    phi = basis(s, poles)
+    n = phi.shape[1]
+    rows = []
+    rhs = []
+    for k in range(h.shape[1]): # eliminate each entry's residues, keeping the shared sigma
+        A = realify(np.hstack([phi, np.ones((len(s), 1)), -h[:, k:k+1] * phi]))
+        q, r = np.linalg.qr(A)
+        rows.append(r[n+1:, n+1:])
+        rhs.append(q[:, n+1:].T @ realify(h[:, k]))
+    c = np.linalg.lstsq(np.vstack(rows), np.concatenate(rhs), rcond=None)[0]
+    A = np.zeros((n, n))
+    b = np.zeros(n)
+    i = 0
+    for a in poles:
+        if a.imag == 0:
+            A[i, i] = a.real
+            b[i] = 1
+            i += 1
+        else:
+            A[i:i+2, i:i+2] = [[a.real, a.imag], [-a.imag, a.real]]
+            b[i] = 2
+            i += 2
+    z = np.linalg.eigvals(A - np.outer(b, c))
+    z = np.where(z.real > 0, -z.conjugate(), z)
+    return [complex(p.real, 0) if abs(p.imag) <= 1e-9 * abs(p) else p
+            for p in z if p.imag >= 0 or abs(p.imag) <= 1e-9 * abs(p)]
+
+class RationalModel():
+    """
+    s(f) = d + sum over poles of their residue terms, common poles for every
+    entry of the sampled s[f, ...], stable and so causal and real in time
+    w0: frequency normalization, rad/s
+    """
+    def __init__(self, poles, coefficients, w0, shape):
+        self.poles = poles
+        self.coefficients = coefficients
+        self.w0 = w0
+        self.shape = shape
+        self.order = coefficients.shape[0] - 1
+
+    def __call__(self, f):
+        s = 2j * np.pi * np.atleast_1d(np.asarray(f, dtype=float)) / self.w0
+        phi = np.hstack([basis(s, self.poles), np.ones((len(s), 1))])
+        return (phi @ self.coefficients).reshape((len(s),) + self.shape)
+
+    def write_touchstone(self, filename, fmin, fmax, npoints, z0=50, **kwargs):
+        """ write the model at npoints from fmin to fmax, see touchstone.write_touchstone() """
+        f = np.linspace(fmin, fmax, npoints)
+        write_touchstone(filename, f, self(f), z0, **kwargs)
+
+def fit(f, h, order, iterations=10):
+    """
+    vector fit h[f, ...] with order (even) poles, returns a RationalModel
+    """
+    shape = h.shape[1:]
+    h = h.reshape(len(f), -1)
+    w0 = 2 * np.pi * np.max(f)
+    s = 2j * np.pi * np.asarray(f, dtype=float) / w0
+    # starting poles spread over the band, above 0 where basis() would divide by zero
+    w = np.linspace(max(np.min(f), np.max(f) / order), np.max(f), order // 2) * 2 * np.pi / w0
+    poles = list(-w / 100 + 1j * w)
+    for i in range(iterations):
+        poles = relocate(s, h, poles)
+    phi = realify(np.hstack([basis(s, poles), np.ones((len(s), 1))]))
+    coefficients = np.linalg.lstsq(phi, np.concatenate([h.real, h.imag]), rcond=None)[0]
+    return RationalModel(poles, coefficients, w0, shape)
+
+def fit_order(f, h, tol, max_order=40):
+    """ fit() with the lowest even order fitting every sample within tol / 10 """
+    best = None
+    for order in range(2, max(2, min(max_order, 2 * (len(f) // 3))) + 1, 2):
+        model = fit(f, h, order)
+        err = np.max(np.abs(model(f) - h))
+        if best is None or err < best[0]:
+            best = (err, model)
+        if err <= tol / 10:
+            break
+    return best[1]
+
+def sample(response, fmin, fmax, tol=1e-3, npoints=9, max_points=1001, max_order=40):
+    """
+    Sample response(f) -> s[f, ...] from fmin to fmax, starting with npoints
+    and adding the midpoints where the fitted model and one of 2 higher order
+    disagree by more than tol. Once they agree everywhere the model must
+    predict every midpoint within tol, or those are added too.
+    Stops with a warning at max_points.
+    returns (RationalModel, f, s) with the samples it was fitted to
+    """
+    f = np.linspace(fmin, fmax, npoints)
+    h = np.asarray(response(f))
+    def error(a, b):
+        return np.abs(a - b).reshape(len(a), -1).max(axis=1)
+    while True:
+        model = fit_order(f, h, tol, max_order)
+        candidates = 0.5 * (f[1:] + f[:-1])
+        u = error(model(candidates), fit(f, h, model.order + 2)(candidates))
+        new = candidates[u > tol]
+        validate = len(new) == 0
+        if validate:
+            new = candidates
+        if len(f) + len(new) > max_points:
+            print("warning: adaptive sampling stopped at {} points".format(len(f)))
+            if len(f) >= max_points:
+                return model, f, h
+            new = np.sort(candidates[np.argsort(u)[::-1][:max_points - len(f)]])
+        hn = np.asarray(response(new))
+        if validate and np.all(error(model(new), hn) <= tol):
+            return model, f, h
+        f = np.concatenate([f, new])
+        h = np.concatenate([h, hn])
+        i = np.argsort(f)
+        f = f[i]
+        h = h[i]
@@ -0,0 +1,286 @@
+"""
+Solver backends: where OpenEMS gets its CSX structure and FDTD solver.
+EngineBackend uses the CSXCAD and openEMS bindings. RecordingBackend is
+pure Python: it records the geometry, mesh and port calls into NumPy
+arrays and synthesizes the port probes from an analytic S matrix model,
+so everything around the engine runs without it.
+Set the backend with use(), OpenEMS.backend or PYOPENEMS_BACKEND=recording.
+"""
+import os, json, time, shutil
+import numpy as np
+
+class EngineBackend():
+    """ the CSXCAD and openEMS bindings """
+    def structure(self):
+        from CSXCAD import ContinuousStructure
+        return ContinuousStructure()
+
+    def solver(self, NrTS, EndCriteria):
+        from openEMS import openEMS
+        return openEMS(NrTS=NrTS, EndCriteria=EndCriteria)
+
+class RecordingPrimitive():
+    def __init__(self, box):
+        self.box = box
+
+    def GetBoundBox(self):
+        return self.box
+
+class RecordingProperty():
+    """ a CSX property, the primitives added to it go to the structure's arrays """
+    def __init__(self, csx, kind, name, **kwargs):
+        self.csx = csx
+        self.index = len(csx.properties)
+        self.kind = kind
+        self.name = name
+        self.kwargs = kwargs
+        self.primitives = []
+
+    def GetTypeString(self):
+        return self.kind
+
+    def GetName(self):
+        return self.name
+
+    def GetAllPrimitives(self):
+        return self.primitives
+
+    def AddBox(self, start, stop, priority=0, **kwargs):
+        self.csx._boxes.append([self.index, priority] + list(start) + list(stop))
+        self.primitives.append(RecordingPrimitive(np.array([start, stop], dtype=float)))
+        return self.primitives[-1]
+
+    def AddCylinder(self, start, stop, radius, priority=0, **kwargs):
+        self.csx._cylinders.append([self.index, priority] + list(start) + list(stop) + [radius])
+        lo = np.minimum(start, stop) - radius
+        hi = np.maximum(start, stop) + radius
+        self.primitives.append(RecordingPrimitive(np.array([lo, hi], dtype=float)))
+        return self.primitives[-1]
+
+    def AddLinPoly(self, points, norm_dir, elevation, length, priority=0, **kwargs):
+        points = np.array(points, dtype=float)
+        self.csx.polygons.append((self.index, priority, norm_dir, elevation, length, points))
+        self.primitives.append(RecordingPrimitive(None))
+        return self.primitives[-1]
+
+class RecordingGrid():
+    """ CSX rectilinear grid, SmoothMeshLines splits gaps evenly rather than grading """
+    def __init__(self):
+        self.lines = {'x': [], 'y': [], 'z': []}
+        self.delta_unit = 1.0
+
+    def SetDeltaUnit(self, unit):
+        self.delta_unit = unit
+
+    def AddLine(self, d, v):
+        self.lines[d] += list(np.atleast_1d(np.asarray(v, dtype=float)))
+
+    def SetLines(self, d, v):
+        self.lines[d] = list(np.atleast_1d(np.asarray(v, dtype=float)))
+
+    def ClearLines(self, d):
+        self.lines[d] = []
+
+    def GetLines(self, d, do_sort=False):
+        lines = np.array(self.lines[d], dtype=float)
+        return np.unique(lines) if do_sort else lines
+
+    def GetQtyLines(self, d):
+        return len(np.unique(self.lines[d]))
+
+    def SmoothMeshLines(self, d, resolution, ratio=1.5):
+        lines = np.unique(self.lines[d])
+        rv = [lines[:1]]
+        for (a, b) in zip(lines[:-1], lines[1:]):
+            rv.append(np.linspace(a, b, max(1, int(np.ceil((b - a) / resolution))) + 1)[1:])
+        self.lines[d] = list(np.concatenate(rv))
+
+class RecordingStructure():
+    """
+    CSXCAD ContinuousStructure stand in
+    boxes: rows of property index, priority, start[3], stop[3]
+    cylinders: rows of property index, priority, start[3], stop[3], radius
+    polygons: [(property index, priority, normal, elevation, length, points[2, n])]
+    """
+    def __init__(self):
+        self.properties = []
+        self._boxes = []
+        self._cylinders = []
+        self.polygons = []
+        self.grid = RecordingGrid()
+
+    boxes = property(lambda self: np.array(self._boxes, dtype=float).reshape(-1, 8))
+    cylinders = property(lambda self: np.array(self._cylinders, dtype=float).reshape(-1, 9))
+
+    def add(self, kind, name, **kwargs):
+        self.properties.append(RecordingProperty(self, kind, name, **kwargs))
+        return self.properties[-1]
+
+    def AddMaterial(self, name, **kwargs):
+        return self.add('Material', name, **kwargs)
+
+    def AddMetal(self, name):
+        return self.add('Metal', name)
+
+    def AddConductingSheet(self, name, **kwargs):
+        return self.add('ConductingSheet', name, **kwargs)
+
+    def AddLumpedElement(self, name, **kwargs):
+        return self.add('LumpedElement', name, **kwargs)
+
+    def AddDump(self, name, **kwargs):
+        return self.add('DumpBox', name, **kwargs)
+
+    def GetAllProperties(self):
+        return self.properties
+
+    def GetGrid(self):
+        return self.grid
+
+    def describe(self):
+        """ everything recorded, as JSON compatible data """
+        return {'properties': [(p.kind, p.name, p.kwargs) for p in self.properties],
+                'boxes': self._boxes, 'cylinders': self._cylinders,
+                'polygons': [p[:5] + (p[5].tolist(),) for p in self.polygons],
+                'grid': {d: sorted(self.grid.lines[d]) for d in 'xyz'}}
+
+    def Write2XML(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.describe(), f, default=float)
+
+class RecordingPort():
+    """ openEMS lumped port stand in, CalcPort reads the probes Run synthesized """
+    reads_archive = True # CalcPort reads archived probes, see spectrum.UIData
+
+    def __init__(self, number, R, start, stop, p_dir, excite):
+        self.number = number
+        self.R = R
+        self.start = np.array(start, dtype=float)
+        self.stop = np.array(stop, dtype=float)
+        self.p_dir = p_dir
+        self.excite = excite
+        self.U_filenames = ['port_ut{}'.format(number)]
+        self.I_filenames = ['port_it{}'.format(number)]
+
+    def CalcPort(self, sim_path, freq, ref_impedance=None, **kwargs):
+        from openems import spectrum
+        z = self.R if ref_impedance is None else ref_impedance
+        self.uf_tot = spectrum.UIData(self.U_filenames, sim_path, freq).ui_f_val[0]
+        self.if_tot = spectrum.UIData(self.I_filenames, sim_path, freq).ui_f_val[0]
+        self.uf_inc = 0.5 * (self.uf_tot + self.if_tot * z)
+        self.if_inc = 0.5 * (self.if_tot + self.uf_tot / z)
+        self.uf_ref = self.uf_tot - self.uf_inc
+        self.if_ref = self.if_inc - self.if_tot
+
+def line_model(f, ports, reflection=0.03, velocity=1.5e8):
+    """
+    s[f, i, j] of lossless matched lines joining every pair of ports,
+    delayed by the distance between their centers at velocity
+    """
+    n = len(ports)
+    centers = np.array([0.5 * (p.start + p.stop) for p in ports])
+    d = np.sqrt(np.sum(np.square(centers[:, None] - centers[None, :]), axis=2))
+    t = np.sqrt((1.0 - reflection**2) / max(1, n - 1))
+    s = t * np.exp(-2j * np.pi * f[:, None, None] * d[None] / velocity)
+    s[:, np.arange(n), np.arange(n)] = reflection
+    return s
+
+class RecordingSolver():
+    """
+    openEMS stand in: Run writes port probes for a gaussian wave into the
+    excited port and the response model(f, ports) -> s[f, i, j], every
+    call is kept in runs
+    """
+    def __init__(self, NrTS, EndCriteria, model):
+        self.NrTS = NrTS
+        self.EndCriteria = EndCriteria
+        self.model = model
+        self.ports = []
+        self.runs = []
+        self.boundaries = None
+        self.csx = None
+        self.f0 = 0
+        self.fc = 0
+
+    def SetGaussExcite(self, f0, fc):
+        self.f0 = f0
+        self.fc = fc
+
+    def SetBoundaryCond(self, bc):
+        self.boundaries = list(bc)
+
+    def SetCSX(self, csx):
+        self.csx = csx
+
+    def AddLumpedPort(self, port_nr, R, start, stop, p_dir, excite=0, **kwargs):
+        self.ports.append(RecordingPort(port_nr, R, start, stop, p_dir, excite))
+        return self.ports[-1]
+
+    def Write2XML(self, filename):
+        d = self.csx.describe() if self.csx else {}
+        d['fdtd'] = {'NrTS': self.NrTS, 'EndCriteria': self.EndCriteria, 'f0': self.f0, 'fc': self.fc,
+                     'boundaries': self.boundaries,
+                     'ports': [(p.number, p.R, p.start.tolist(), p.stop.tolist(), p.p_dir, p.excite)
+                               for p in self.ports]}
+        with open(filename, 'w') as f:
+            json.dump(d, f, default=float)
+
+    def Run(self, sim_path, cleanup=False, verbose=None, numThreads=None, **kwargs):
+        if cleanup and os.path.exists(sim_path):
+            shutil.rmtree(sim_path)
+        os.makedirs(sim_path, exist_ok=True)
+        start = time.time()
+        self.Write2XML(os.path.join(sim_path, 'recording.json'))
+        fmax = self.f0 + self.fc
+        dt = 1.0 / (20.0 * fmax)
+        t0 = 9.0 / (2 * np.pi * self.fc) # openEMS gaussian excitation delay
+        n = int(min(self.NrTS, 8.0 * t0 / dt + 4096))
+        t = np.arange(n) * dt
+        a = np.cos(2 * np.pi * self.f0 * (t - t0)) * np.exp(-np.square((t - t0) / (3.0 / (2 * np.pi * self.fc))))
+        f = np.fft.rfftfreq(n, dt)
+        A = np.fft.rfft(a)
+        s = self.model(f, self.ports)
+        for (j, p) in enumerate(self.ports):
+            if not p.excite:
+                continue
+            for (i, q) in enumerate(self.ports):
+                b = np.fft.irfft(s[:, i, j] * A, n)
+                u = b + (p.excite * a if i == j else 0)
+                current = (u - 2 * b) / q.R # i = (a - b) / R
+                for (name, x) in [('ut', u), ('it', current)]:
+                    np.savetxt(os.path.join(sim_path, 'port_{}{}'.format(name, q.number)), np.c_[t, x],
+                               header='recording backend', comments='% ')
+        self.runs.append({'sim_path': sim_path, 'timesteps': n, 'numThreads': numThreads})
+        if verbose:
+            # as openEMS reports it, see profiling.parse_engine()
+            grid = self.csx.grid if self.csx else RecordingGrid()
+            cells = int(np.prod([max(0, grid.GetQtyLines(d) - 1) for d in 'xyz']))
+            seconds = max(time.time() - start, 1e-9)
+            print("Time for {} iterations with {} cells : {:.3f} sec".format(n, cells, seconds))
+            print("Speed: {:.3f} MC/s".format(cells * n / seconds / 1e6), flush=True)
+
+class RecordingBackend():
+    """ pure Python backend, model(f, ports) -> s[f, i, j], default line_model() """
+    def __init__(self, model=None):
+        self.model = model or line_model
+
+    def structure(self):
+        return RecordingStructure()
+
+    def solver(self, NrTS, EndCriteria):
+        return RecordingSolver(NrTS, EndCriteria, self.model)
+
+default = None
+
+def use(backend):
+    """ the backend for OpenEMS instances created from now on, None for the default """
+    global default
+    default = backend
+
+def current():
+    """ the backend set by use(), else from PYOPENEMS_BACKEND ('engine' or 'recording') """
+    if default is not None:
+        return default
+    if os.environ.get('PYOPENEMS_BACKEND') == 'recording':
+        return RecordingBackend()
+    return EngineBackend()
@@ -0,0 +1,268 @@
+"""
+Benchmarks of everything around the solver, run with the recording
+backend (see backend.py) so no engine is needed:
+each script under examples/ is loaded with run_openems and write_kicad
+deferred, then the scene build, generate (with its mesh phase), the CSX
+serialization, write_kicad and the post-processing of synthesized probes
+are timed; synthetic workloads are scaled to expose super-linear growth.
+Results are appended to a JSON lines file with the git revision.
+python -m openems.benchmark [examples|scaling|compare [old] [new]]
+"""
+import os, sys, json, time, glob, runpy, socket, tempfile, contextlib, subprocess
+import numpy as np
+import openems
+from openems import backend, profiling
+from openems.cache import default_path
+from openems.parallel import fork_map
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+example_dir = os.path.join(package_dir, 'examples')
+argv = {'idbpf_tap_oshpark/filter.py': ['3'], 'capacitor_ground_cutout.py': ['0402']} # command line some examples need
+sizes = {'via_fence': [100, 1000, 10000], 'polygon': [50, 500, 5000]}
+
+def results_path():
+    return os.path.join(default_path(), 'benchmarks.jsonl')
+
+def revision():
+    """ git describe of the package, None outside a git checkout """
+    try:
+        r = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=package_dir,
+                           capture_output=True, text=True)
+    except OSError:
+        return None
+    return r.stdout.strip() or None
+
+def examples(directory=example_dir):
+    """ example scripts relative to directory, excluding the openems package link """
+    scripts = glob.glob(os.path.join(directory, '*.py')) + glob.glob(os.path.join(directory, '*', '*.py'))
+    scripts = [os.path.relpath(s, directory) for s in scripts]
+    return sorted(s for s in scripts if not s.startswith('openems' + os.sep))
+
+def load(script, directory=example_dir):
+    """
+    run an example script with write_kicad and run_openems deferred
+    returns [(em, [(args, kwargs) of each write_kicad call])] in order of first use
+    """
+    scenes = []
+    def scene(em):
+        for s in scenes:
+            if s[0] is em:
+                return s
+        scenes.append((em, []))
+        return scenes[-1]
+    cls = openems.OpenEMS
+    saved = (cls.write_kicad, cls.run_openems, sys.argv)
+    cls.write_kicad = lambda em, *args, **kwargs: scene(em)[1].append((args, kwargs))
+    cls.run_openems = lambda em, *args, **kwargs: scene(em) and None
+    sys.argv = [script] + argv.get(script, [])
+    try:
+        runpy.run_path(os.path.join(directory, script), run_name='__main__')
+    finally:
+        cls.write_kicad, cls.run_openems, sys.argv = saved
+    return scenes
+
+def process(em, profile, kicad_calls=None, postprocess=True):
+    """ generate, serialize, write_kicad and (with ports) post-process em as phases of profile """
+    em.profile = profile
+    with profile.phase('generate'):
+        em.generate()
+    with profile.phase('serialize'):
+        em.FDTD.Write2XML(os.path.join(em.get_simpath(), 'scene.xml'))
+    with profile.phase('write_kicad'):
+        for (args, kwargs) in kicad_calls or [((em.name,), {})]:
+            em.write_kicad(*args, **kwargs)
+    if not (postprocess and em.ports):
+        return
+    em.cache = None
+    em.plot_formats = []
+    em.run_openems('solve', show_plot=False) # synthesizes the probes, not timed
+    with profile.phase('postprocess'):
+        em.run_openems('postprocess', show_plot=False)
+    profile.extend(em.profile.phases) # calc_port, touchstone, ...
+
+def summary(profile):
+    """ {phase: total seconds} """
+    rv = {}
+    for p in profile.phases:
+        rv[p['phase']] = rv.get(p['phase'], 0.0) + p['seconds']
+    return rv
+
+def _example(script, directory):
+    profile = profiling.Profile()
+    backend.use(backend.RecordingBackend())
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        os.chdir(tmp)
+        with profile.phase('build'):
+            scenes = load(script, directory)
+        for (em, kicad_calls) in scenes:
+            em.simpath = os.path.join(tmp, 'sim_' + os.path.basename(em.name))
+            os.makedirs(em.simpath, exist_ok=True)
+            process(em, profile, kicad_calls)
+        cells = sum(em.cells() for (em, k) in scenes)
+        return dict(objects=sum(len(em.objects) for (em, k) in scenes), cells=cells,
+                    phases=summary(profile))
+
+def best(results):
+    """ per phase minimum of the phases of repeated results """
+    rv = dict(results[0])
+    rv['phases'] = {k: min(r['phases'][k] for r in results) for k in results[0]['phases']}
+    return rv
+
+def run_examples(scripts=None, directory=example_dir, repeat=3, path=None):
+    """
+    benchmark each example script (default all of examples()), each repeat
+    in a fresh process, keeping the fastest of each phase
+    returns the records, appended to path (default results_path())
+    """
+    scripts = scripts or examples(directory)
+    records = []
+    for script in scripts:
+        def run(i):
+            try:
+                return _example(script, directory)
+            except Exception as e:
+                return {'error': '{}: {}'.format(type(e).__name__, e)}
+        results = fork_map(run, range(repeat), 1)
+        if 'error' in results[0]:
+            print("examples/{}: {}".format(script, results[0]['error']))
+            records.append(record('examples/' + script, **results[0]))
+            continue
+        records.append(record('examples/' + script, **best(results)))
+        print(format_record(records[-1]))
+    save(records, path)
+    return records
+
+def via_fence(n, pitch=0.5e-3):
+    """ an OpenEMS with n vias on a square grid of pitch over a ground plane """
+    em = openems.OpenEMS('via_fence_{}'.format(n), fmin=1e9, fmax=10e9)
+    cu = openems.Metal(em, 'cu')
+    sub = openems.Dielectric(em, 'sub', eps_r=3.5)
+    k = int(np.ceil(np.sqrt(n)))
+    size = k * pitch
+    sub.AddBox([0, 0, 0], [size, size, 0.2e-3], 1)
+    cu.AddBox([0, 0, 0], [size, size, -0.035e-3], 9)
+    z = [[0.2e-3, 0], [0.2e-3, 0.235e-3]]
+    for i in range(n):
+        openems.Via(cu, 9, (0.5 + i % k) * pitch, (0.5 + i // k) * pitch, z, 0.1e-3, 0.15e-3, padname='1')
+    em.resolution = pitch / 4
+    return em
+
+def polygon(n, r=2e-3):
+    """ an OpenEMS with an n vertex polygon of radius r """
+    em = openems.OpenEMS('polygon_{}'.format(n), fmin=1e9, fmax=10e9)
+    cu = openems.Metal(em, 'cu')
+    a = 2 * np.pi * np.arange(n) / n
+    rn = r * (1.0 + 0.1 * np.cos(7 * a))
+    openems.Polygon(cu, np.array([rn * np.cos(a), rn * np.sin(a)]).T, [0, 0.035e-3], priority=9)
+    for d in 'xyz':
+        em.mesh.AddLine(d, [-1.5 * r, 1.5 * r])
+    em.resolution = r / 20
+    return em
+
+workloads = {'via_fence': via_fence, 'polygon': polygon}
+
+def _workload(name, n):
+    profile = profiling.Profile()
+    backend.use(backend.RecordingBackend())
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        os.chdir(tmp)
+        with profile.phase('build'):
+            em = workloads[name](n)
+        em.simpath = tmp
+        process(em, profile, postprocess=False)
+        return dict(objects=len(em.objects), cells=em.cells(), phases=summary(profile))
+
+def growth(records):
+    """
+    {phase: exponent} of seconds ~ size^exponent between the two largest
+    sizes of records of one workload, above about 1.2 is super-linear
+    """
+    records = sorted(records, key=lambda r: r['size'])[-2:]
+    if len(records) < 2:
+        return {}
+    (a, b) = records
+    rv = {}
+    for phase in a['phases']:
+        if a['phases'][phase] > 0 and b['phases'].get(phase, 0) > 0:
+            rv[phase] = np.log(b['phases'][phase] / a['phases'][phase]) / np.log(b['size'] / a['size'])
+    return rv
+
+def run_scaling(names=None, repeat=3, path=None):
+    """ benchmark each workload at each of its sizes, printing the growth exponent of each phase """
+    records = []
+    for name in names or sorted(workloads):
+        rows = []
+        for n in sizes[name]:
+            results = fork_map(lambda i: _workload(name, n), range(repeat), 1)
+            rows.append(record('{}/{}'.format(name, n), size=n, **best(results)))
+            print(format_record(rows[-1]))
+        for (phase, exponent) in growth(rows).items():
+            print("  {:16s} grows as n^{:.2f}{}".format(phase, exponent, ' super-linear' if exponent > 1.2 else ''))
+        records += rows
+    save(records, path)
+    return records
+
+def record(benchmark, **result):
+    return dict(benchmark=benchmark, revision=revision(), host=socket.gethostname(), time=time.time(),
+                **result)
+
+def format_record(r):
+    phases = ' '.join('{}={:.3g}'.format(k, v) for (k, v) in r['phases'].items())
+    return "{}: {} objects, {} cells, {}".format(r['benchmark'], r.get('objects'), r.get('cells'), phases)
+
+def save(records, path=None):
+    path = path or results_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for r in records:
+        profiling.write(r, path)
+
+def load_results(path=None):
+    try:
+        with open(path or results_path()) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+def compare(old=None, new=None, path=None, host=None):
+    """
+    print new / old seconds of each benchmark phase run on this host at both
+    revisions (default the last two benchmarked), the latest record of each
+    returns {(benchmark, phase): ratio}
+    """
+    host = host or socket.gethostname()
+    records = [r for r in load_results(path) if r.get('host') == host and 'phases' in r]
+    revisions = []
+    for r in records:
+        if r['revision'] in revisions:
+            revisions.remove(r['revision'])
+        revisions.append(r['revision'])
+    if old is None and new is None:
+        if len(revisions) < 2:
+            raise Exception("need benchmarks of two revisions to compare, have {}".format(revisions))
+        old, new = revisions[-2:]
+    new = new or revisions[-1]
+    latest = {}
+    for r in records:
+        latest[(r['revision'], r['benchmark'])] = r
+    rv = {}
+    print("{} / {}".format(new, old))
+    for ((rev, benchmark), r) in sorted(latest.items()):
+        if rev != new or (old, benchmark) not in latest:
+            continue
+        before = latest[(old, benchmark)]['phases']
+        for (phase, seconds) in r['phases'].items():
+            if before.get(phase):
+                rv[(benchmark, phase)] = seconds / before[phase]
+                print("{:40s} {:16s} {:10.4f} s {:6.2f}x".format(benchmark, phase, seconds, rv[(benchmark, phase)]))
+    return rv
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'examples'
+    if command == 'examples':
+        run_examples(sys.argv[2:])
+    elif command == 'scaling':
+        run_scaling(sys.argv[2:])
+    elif command == 'compare':
+        compare(*sys.argv[2:4])
+    else:
+        print(__doc__)
@@ -0,0 +1,86 @@
+import os, hashlib
+import numpy as np
+
+def default_path():
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'pyopenems')
+
+def scene_hash(em, *extra):
+    """
+    hash of everything that determines a solve of em after generate():
+    the openEMS XML (CSX structure, mesh, excitation, boundaries, end criteria),
+    and any extra arrays such as the frequency list and reference impedance
+    """
+    import tempfile
+    h = hashlib.sha256()
+    fd, xml = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+    try:
+        em.FDTD.Write2XML(xml)
+        with open(xml, 'rb') as f:
+            h.update(f.read())
+    finally:
+        os.remove(xml)
+    for d in 'xyz':
+        h.update(np.asarray(em.mesh.GetLines(d, do_sort=True), dtype=float).tobytes())
+    h.update(repr((list(em.boundaries), em.excitation_port, em.EndCriteria, em.NrTS,
+                   getattr(em, 'early_stop', None))).encode())
+    for x in extra:
+        h.update(np.asarray(x, dtype=complex).tobytes())
+    return h.hexdigest()
+
+class Cache():
+    """
+    solved port data stored by scene_hash()
+    max_bytes: after a store the least recently used entries are removed
+    until the cache is no larger, None for no limit
+    """
+    def __init__(self, path=None, max_bytes=1e9):
+        self.path = path if path else default_path()
+        self.max_bytes = max_bytes
+
+    def filename(self, key):
+        return os.path.join(self.path, key[:2], key + '.npz')
+
+    def load(self, key):
+        """ returns a dict of arrays or None on a miss """
+        try:
+            with np.load(self.filename(key)) as d:
+                rv = dict(d)
+            os.utime(self.filename(key)) # recently used
+            return rv
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, **arrays):
+        fn = self.filename(key)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        # write then rename so parallel solves never see a partial file
+        import tempfile
+        fd, tmp = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(fn))
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, fn)
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        """ remove the least recently used entries until no more than max_bytes are stored """
+        entries = []
+        for (d, dirs, files) in os.walk(self.path):
+            for n in files:
+                if n.endswith('.npz'):
+                    try:
+                        st = os.stat(os.path.join(d, n))
+                    except OSError: # removed by a parallel solve
+                        continue
+                    entries.append((st.st_mtime, st.st_size, os.path.join(d, n)))
+        total = sum(size for (mtime, size, fn) in entries)
+        for (mtime, size, fn) in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+            total -= size
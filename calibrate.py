@@ -0,0 +1,138 @@
+"""
+Host throughput profile: the openEMS engine speed on synthetic vacuum
+meshes of several sizes and thread counts, stored per host, used to pick
+numThreads and to pack sweep jobs.
+python -m openems.calibrate [timesteps] to (re)calibrate this host
+"""
+import os, sys, json, time, socket
+import numpy as np
+import openems
+from openems.cache import default_path
+from openems.parallel import fork_map
+
+default_threads = 8 # without a profile
+
+def profile_path():
+    return os.path.join(default_path(), 'host_{}.json'.format(socket.gethostname()))
+
+def _benchmark(n, threads, timesteps, index=0):
+    em = openems.OpenEMS('calibrate{}_{}_{}'.format(n, threads, index), fmin=1e9, fmax=10e9,
+                         NrTS=timesteps, EndCriteria=0)
+    em.resolution = [None, None, None]
+    em.cache = None
+    h = 1e-3
+    for d in 'xyz':
+        em.mesh.AddLine(d, np.linspace(-0.5 * n * h, 0.5 * n * h, n + 1))
+    openems.Port(em, [0, 0, -h], [0, 0, h], 'z', 50)
+    em.generate()
+    simpath = em.get_simpath()
+    start = time.time()
+    em.FDTD.Run(simpath, verbose=0, cleanup=True, numThreads=threads)
+    return time.time() - start
+
+def benchmark(n, threads, timesteps=1000, jobs=1):
+    """
+    total cell updates per second of jobs concurrent solves of an n^3 cell
+    vacuum mesh, from the time difference between timesteps/4 and timesteps
+    steps so the setup cancels
+    """
+    def run(steps):
+        return max(fork_map(lambda i: _benchmark(n, threads, steps, i), range(jobs), jobs))
+    t1, t2 = run(timesteps // 4), run(timesteps)
+    if t2 > t1:
+        return jobs * n**3 * (timesteps - timesteps // 4) / (t2 - t1)
+    return jobs * n**3 * timesteps / t2
+
+def calibrate(sizes=[20, 50, 100], threads=None, timesteps=1000, save=True):
+    """
+    benchmark each n^3 mesh in sizes with each thread count (default
+    powers of 2 up to the cores), alone and as many concurrent jobs as fit
+    the cores, and save the profile for this host
+    """
+    cores = os.cpu_count() or 1
+    if threads is None:
+        threads = sorted(set([2**i for i in range(cores.bit_length()) if 2**i <= cores] + [cores]))
+    results = []
+    concurrent = []
+    for n in sizes:
+        for t in threads:
+            speed = benchmark(n, t, timesteps)
+            print("{}^3 cells, {} threads: {:.3g} cells/s".format(n, t, speed))
+            results.append([n**3, t, speed])
+            jobs = cores // t
+            if jobs > 1:
+                total = benchmark(n, t, timesteps, jobs)
+                print("{}^3 cells, {} jobs of {} threads: {:.3g} cells/s".format(n, jobs, t, total))
+                concurrent.append([n**3, t, jobs, total])
+    profile = {'host': socket.gethostname(), 'cores': cores, 'timesteps': timesteps, 'results': results,
+               'concurrent': concurrent}
+    if save:
+        os.makedirs(os.path.dirname(profile_path()), exist_ok=True)
+        with open(profile_path(), 'w') as f:
+            json.dump(profile, f, indent=1)
+    return profile
+
+def load_profile(path=None):
+    """ the profile saved by calibrate() for this host, or None """
+    try:
+        with open(path or profile_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def speed(profile, cells, threads):
+    """ cells per second with threads, interpolated in log(cells) """
+    calibrated = sorted(set(r[1] for r in profile['results']))
+    t = max([c for c in calibrated if c <= threads] or calibrated[:1])
+    rows = sorted((r[0], r[2]) for r in profile['results'] if r[1] == t)
+    return float(np.interp(np.log(cells), np.log([r[0] for r in rows]), [r[1] for r in rows]))
+
+def best_threads(cells, max_threads=None, profile=None):
+    """
+    (threads, cells per second) fastest for a mesh of cells, at most
+    max_threads (default the cores), (default_threads, None) without a profile
+    """
+    profile = profile or load_profile()
+    max_threads = max_threads or os.cpu_count() or 1
+    if not profile:
+        return min(default_threads, max_threads), None
+    candidates = sorted(set(r[1] for r in profile['results'] if r[1] <= max_threads)) or [1]
+    return max(((t, speed(profile, cells, t)) for t in candidates), key=lambda x: x[1])
+
+def throughput(profile, cells, threads, jobs):
+    """
+    total cells per second of jobs concurrent solves with threads each, at
+    most the calibrated concurrent figure, or for a profile without one the
+    fastest single job as the engine is memory bound
+    """
+    single = speed(profile, cells, threads)
+    if jobs <= 1:
+        return single
+    rows = sorted((r[0], r[3]) for r in profile.get('concurrent', []) if r[1] == threads)
+    if rows:
+        total = float(np.interp(np.log(cells), np.log([r[0] for r in rows]), [r[1] for r in rows]))
+    else:
+        total = best_threads(cells, profile.get('cores'), profile)[1]
+    return min(jobs * single, total)
+
+def pack(cells, jobs, cores=None, profile=None, threads=4):
+    """
+    (threads per job, concurrent jobs) finishing jobs solves of cells soonest
+    on cores, threads per job without a profile, of equal candidates the one
+    with the fewest concurrent jobs (and the least memory)
+    """
+    profile = profile or load_profile()
+    cores = cores or os.cpu_count() or 1
+    if not profile:
+        return threads, max(1, min(jobs, cores // threads))
+    best = None
+    for t in sorted(set(r[1] for r in profile['results'] if r[1] <= cores) or [1], reverse=True):
+        n = max(1, min(jobs, cores // t))
+        finish = np.ceil(jobs / n) * n / throughput(profile, cells, t, n)
+        if best is None or finish < best[0] * (1 - 1e-9):
+            best = (finish, t, n)
+    return best[1], best[2]
+
+if __name__ == "__main__":
+    calibrate(timesteps=int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
+    print("saved", profile_path())
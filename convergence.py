@@ -0,0 +1,102 @@
+import os, time, copy
+import numpy as np
+from .parallel import fork_map
+from .mesher import AutoMesh
+from . import estimate
+
+def refine(em, scale):
+    """ multiply the cell sizes of em by scale, em.resolution or the AutoMesh ones for 'auto' """
+    if isinstance(em.resolution, str):
+        em.mesher = copy.copy(em.mesher) if em.mesher else AutoMesh()
+        em.mesher.scale *= scale
+    elif hasattr(em.resolution, '__len__'):
+        em.resolution = [r * scale if r is not None else None for r in em.resolution]
+    else:
+        em.resolution = em.resolution * scale
+
+def _run_level(builder, index, scale, z, numThreads, all_ports, nprocesses, available):
+    em = builder()
+    em.concurrent = nprocesses
+    if em.memory_budget == 'auto': # RAM available before the batch started
+        em.memory_budget = available
+    refine(em, scale)
+    em.simpath = em.get_simpath() + '_conv{}'.format(index)
+    f = np.linspace(em.fmin, em.fmax, em.fsteps)
+    start = time.time()
+    if all_ports:
+        s = em.solve_all_ports(f, z=z, numThreads=numThreads)
+    else:
+        if not os.path.exists(em.simpath):
+            os.mkdir(em.simpath)
+        s = em.solve_excitation(0, em.simpath, f, z, numThreads)
+    runtime = time.time() - start
+    return f, s, em.mesh_report(1).total_cells, runtime
+
+def change(s0, s1, floor=1e-3):
+    """
+    (max |s1| - |s0|, max phase difference in degrees) over the band and every
+    entry, ignoring the phase where both are below floor, and taking it as 0
+    where one is exactly 0
+    """
+    mag = np.max(np.abs(np.abs(s1) - np.abs(s0)))
+    valid = np.maximum(np.abs(s0), np.abs(s1)) >= floor
+    phase = np.max(np.abs(np.angle(s1[valid] * np.conj(s0[valid]), deg=True)), initial=0) # no division by s0
+    return mag, phase
+
+class ConvergenceResult():
+    """
+    One entry per mesh level solved, coarse to fine
+    scales: cell size scale relative to the builder's mesh
+    cells, runtimes (seconds)
+    errors: (|S|, phase in degrees) change to the next finer level, None for the finest
+    converged: index of the coarsest level within tolerance, or None
+    f, s: frequencies and s[level, f, i(, j)]
+    """
+    def __init__(self, scales, cells, runtimes, errors, converged, f, s):
+        self.scales = scales
+        self.cells = cells
+        self.runtimes = runtimes
+        self.errors = errors
+        self.converged = converged
+        self.f = f
+        self.s = s
+
+    def __str__(self):
+        s = "level   scale        cells   runtime (s)    d|S|   dphase (deg)\n"
+        for i in range(len(self.scales)):
+            e = "{:7.4f} {:10.3f}".format(*self.errors[i]) if self.errors[i] else "      -          -"
+            s += "{:5d} {:7.3f} {:12d} {:13.1f} {}{}\n".format(
+                i, self.scales[i], self.cells[i], self.runtimes[i], e, " <" if i == self.converged else "")
+        return s
+
+def converge(builder, start=2.0, factor=0.7, max_levels=6, tol_mag=0.01, tol_phase=1.0,
+             z=50, numThreads=4, nprocesses=None, all_ports=False):
+    """
+    Solve builder() with its cell sizes scaled by start, start * factor, ...
+    until a level is within tol_mag in |S| and tol_phase degrees of the next
+    finer one, or max_levels are solved. print() the result for a report.
+    builder: callable returning an OpenEMS instance with the scene built
+    numThreads: solver threads per level (split over the excitations with all_ports)
+    nprocesses: levels solved at once, default enough to fill the cores,
+    levels past the converged one that were already started are kept
+    """
+    if nprocesses is None:
+        nprocesses = max(1, (os.cpu_count() or 1) // numThreads)
+    scales = []
+    results = []
+    errors = []
+    converged = None
+    while len(scales) < max_levels and converged is None:
+        batch = [start * factor ** i for i in range(len(scales), min(max_levels, len(scales) + nprocesses))]
+        available = estimate.available_memory()
+        jobs = [(builder, len(scales) + i, scale, z, numThreads, all_ports, len(batch), available)
+                for (i, scale) in enumerate(batch)]
+        results += fork_map(lambda job: _run_level(*job), jobs, nprocesses)
+        scales += batch
+        errors = [change(results[i][1], results[i+1][1]) for i in range(len(results) - 1)] + [None]
+        for (i, e) in enumerate(errors[:-1]):
+            if e[0] <= tol_mag and e[1] <= tol_phase:
+                converged = i
+                break
+    return ConvergenceResult(scales, [r[2] for r in results], [r[3] for r in results], errors,
+                             converged, results[0][0], np.stack([r[1] for r in results]))
@@ -0,0 +1,172 @@
+import os, time, glob
+import numpy as np
+
+class ProbeFile():
+    """
+    an openEMS probe file being written, read() parses only the lines
+    appended since the previous call, ignoring a partly written last line
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0 # bytes parsed so far
+        self.data = np.zeros((0, 2))
+        self.n = 0 # rows of data in use, it grows by doubling
+
+    def read(self):
+        """ t, value of every complete line so far """
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            text = f.read()
+        end = text.rfind(b'\n') + 1
+        self.offset += end
+        lines = [l for l in text[:end].decode().splitlines() if l and not l.startswith('%')]
+        if lines:
+            new = np.loadtxt(lines, ndmin=2)[:,:2]
+            if self.n + len(new) > len(self.data):
+                grown = np.zeros((max(2 * len(self.data), self.n + len(new)), 2))
+                grown[:self.n] = self.data[:self.n]
+                self.data = grown
+            self.data[self.n:self.n+len(new)] = new
+            self.n += len(new)
+        return self.data[:self.n,0], self.data[:self.n,1]
+
+def read_probe(filename):
+    """ t, value from an openEMS probe file, ignoring a partly written last line """
+    return ProbeFile(filename).read()
+
+def matrix_pencil(x, order=None, rtol=1e-6):
+    """
+    fit x[k] = sum(a[i] * z[i]**k), returns (z, a)
+    order: number of poles, default from the singular values above rtol
+    """
+    n = len(x)
+    L = n // 3
+    Y = np.lib.stride_tricks.sliding_window_view(x, L + 1)
+    s, Vh = np.linalg.svd(Y, full_matrices=False)[1:]
+    if order is None:
+        order = max(1, int(np.sum(s > rtol * s[0])))
+    V = Vh[:order].conj().T
+    z = np.linalg.eigvals(np.linalg.pinv(V[:-1]) @ V[1:])
+    a = np.linalg.lstsq(np.vander(z, n, increasing=True).T, x.astype(complex), rcond=None)[0]
+    return z, a
+
+class DecayExtrapolation():
+    """
+    Stop a solve early once the port probes are a sum of a few decaying
+    resonances, then extend the probe files with the fitted model so the
+    port calculation sees the full decay.
+    em.early_stop = DecayExtrapolation() enables it for OpenEMS.solve_excitation()
+    window: samples in the fit after decimation to 4 per period at fmax
+    max_order: a tail needing more poles than this is not considered resonant
+    tol: relative error of the fit predicting the last quarter of the window
+    interval: seconds between checks of the running solve
+    """
+    def __init__(self, window=400, max_order=20, tol=1e-3, interval=5.0, rtol=1e-6):
+        self.window = window
+        self.max_order = max_order
+        self.tol = tol
+        self.interval = interval
+        self.rtol = rtol
+
+    def __repr__(self):
+        return "DecayExtrapolation({}, {}, {}, {})".format(self.window, self.max_order, self.tol, self.rtol)
+
+    def tail(self, t, x, fmax, tstart):
+        """ the decimated window at the end of x after tstart, or None if too short """
+        if len(t) < 2:
+            return None
+        dt = t[1] - t[0]
+        stride = max(1, int(1.0 / (4.0 * fmax * dt)))
+        start = max(np.searchsorted(t, tstart, side='right'), len(t) - self.window * stride)
+        x = x[start:][::-1][::stride][::-1]
+        if len(x) < self.window:
+            return None
+        return x[-self.window:], stride * dt
+
+    def predicts(self, x):
+        """ True if a low order fit to the start of x predicts the rest within tol """
+        n = 3 * len(x) // 4
+        z, a = matrix_pencil(x[:n], rtol=self.rtol)
+        if len(z) > self.max_order or np.any(np.abs(z) >= 1.0):
+            return False
+        model = np.real(np.vander(z, len(x), increasing=True).T @ a)
+        return np.linalg.norm(model[n:] - x[n:]) <= self.tol * np.linalg.norm(x[n:])
+
+    def watch(self, simpath, fmax, tstart):
+        """
+        runs in a separate process, creates simpath/ABORT to stop openEMS
+        each check parses only what the probes gained since the last one
+        """
+        good = 0
+        files = {}
+        while True:
+            time.sleep(self.interval)
+            probes = glob.glob(os.path.join(simpath, 'port_ut*'))
+            tails = [self.tail(*files.setdefault(p, ProbeFile(p)).read(), fmax, tstart) for p in probes]
+            if not probes or any(t is None for t in tails):
+                continue
+            good = good + 1 if all(self.predicts(x) for (x, dt) in tails) else 0
+            if good >= 2:
+                open(os.path.join(simpath, 'ABORT'), 'w').close()
+                return
+
+    def start(self, simpath, fmax, tstart):
+        """ start watching a solve, tstart is the end of the excitation """
+        import multiprocessing
+        p = multiprocessing.get_context('fork').Process(target=self.watch, args=(simpath, fmax, tstart))
+        p.daemon = True
+        p.start()
+        return p
+
+    def extend(self, filename, fmax, tstart, end_criteria, max_samples=10000000):
+        """ append the fitted decay to a probe file until it falls to end_criteria of the peak """
+        t, x = read_probe(filename)
+        tail = self.tail(t, x, fmax, tstart)
+        if tail is None:
+            return 0
+        xd, dtd = tail
+        z, a = matrix_pencil(xd, rtol=self.rtol)
+        keep = np.abs(z) < 1.0 # growing poles are fit noise
+        z, a = z[keep], a[keep]
+        if len(z) == 0:
+            return 0
+        s = np.log(z.astype(complex)) / dtd # continuous time poles
+        t0 = t[-1] - (len(xd) - 1) * dtd # time of xd[0]
+        peak = np.max(np.abs(x))
+        slowest = np.max(s.real)
+        tend = t0 + np.log(end_criteria * peak / np.sum(np.abs(a))) / slowest
+        dt = t[1] - t[0]
+        n = int(min(max_samples, max(0, (tend - t[-1]) / dt)))
+        if n == 0:
+            return 0
+        with open(filename, 'a') as f:
+            for k in range(0, n, 100000):
+                tx = t[-1] + dt * np.arange(k + 1, min(n, k + 100000) + 1)
+                model = np.real(np.exp(np.outer(tx - t0, s)) @ a)
+                np.savetxt(f, np.column_stack((tx, model)))
+        return n
+
+    def stop(self, monitor, simpath):
+        """ stop the watcher, returns True if it stopped the solve """
+        monitor.terminate()
+        monitor.join()
+        abort = os.path.join(simpath, 'ABORT')
+        if not os.path.exists(abort):
+            return False
+        os.remove(abort) # the watcher stopped the solve
+        return True
+
+    def finish(self, simpath, fmax, tstart, end_criteria, stopped):
+        """
+        extend every port probe of the solve if the watcher stopped it or
+        the probes of a solve that ran to the end fit a decay anyway
+        """
+        if not stopped:
+            probes = glob.glob(os.path.join(simpath, 'port_ut*'))
+            tails = [self.tail(*read_probe(p), fmax, tstart) for p in probes]
+            if not probes or any(t is None or not self.predicts(t[0]) for t in tails):
+                return
+        for filename in sorted(glob.glob(os.path.join(simpath, 'port_[ui]t*'))):
+            n = self.extend(filename, fmax, tstart, end_criteria)
+            if n:
+                print("{}: extrapolated {} samples".format(os.path.basename(filename), n))
@@ -0,0 +1,140 @@
+"""
+Estimate the peak memory and runtime of a solve before starting it.
+The per cell figures are for the openEMS float32 engine: E, H and four
+operator arrays of 3 components each, the material arrays held while the
+operator is built, the PML and conducting sheet extensions, and field dump
+boxes. The expected number of timesteps covers the excitation and the
+ring down of a low Q structure, NrTS bounds it.
+"""
+import os
+import numpy as np
+import openems
+from openems import calibrate
+
+engine_bytes = 72 # per cell
+setup_bytes = 48 # per cell
+pml_bytes = 48 # per PML cell
+sheet_bytes = 96 # per cell on a conducting sheet
+dump_bytes = 24 # per cell in a dump box
+default_speed = 50e6 # cell updates per second without OpenEMS.cells_per_second or a host profile
+transits = 20 # domain crossings to ring down after the excitation
+
+def cells_in(lines, lo, hi):
+    """ cells of the mesh lines[axis] inside the box lo, hi, at least 1 per axis """
+    n = 1
+    for a in range(3):
+        i = np.searchsorted(lines[a], lo[a], 'left')
+        j = np.searchsorted(lines[a], hi[a], 'right')
+        n *= max(1, j - i)
+    return n
+
+def bounds(o):
+    """ bounding box (lo, hi) of an object from its edges, or None """
+    edges = o.edges()
+    if not edges:
+        return None
+    lo = [min([x for (a, x, side) in edges if a == axis], default=0) for axis in range(3)]
+    hi = [max([x for (a, x, side) in edges if a == axis], default=0) for axis in range(3)]
+    return lo, hi
+
+def dump_boxes(em):
+    """ (lo, hi) of each primitive of the CSX dump properties, if the bindings expose them """
+    rv = []
+    try:
+        for p in em.CSX.GetAllProperties():
+            if 'dump' not in p.GetTypeString().lower():
+                continue
+            for prim in p.GetAllPrimitives():
+                box = np.asarray(prim.GetBoundBox(), dtype=float)
+                rv.append((box[0], box[1]))
+    except AttributeError:
+        pass
+    return rv
+
+def available_memory():
+    """ bytes of RAM available without swapping, from /proc/meminfo where present """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+
+class Estimate():
+    """
+    memory: {part: bytes} of one solve, peak: their sum
+    timesteps: expected, max_timesteps: NrTS
+    runtime: expected seconds at cells_per_second
+    """
+    def __init__(self, cells, memory, timesteps, max_timesteps, cells_per_second):
+        self.cells = cells
+        self.memory = memory
+        self.peak = sum(memory.values())
+        self.timesteps = timesteps
+        self.max_timesteps = max_timesteps
+        self.cells_per_second = cells_per_second
+        self.runtime = cells * timesteps / cells_per_second
+
+    def __str__(self):
+        s = "cells: {}\n".format(self.cells)
+        for (part, b) in self.memory.items():
+            s += "  {:8s} {:10.1f} MB\n".format(part, b / 1e6)
+        s += "peak memory: {:.1f} MB\n".format(self.peak / 1e6)
+        s += "timesteps: {} expected, {} max\n".format(self.timesteps, self.max_timesteps)
+        s += "runtime: {:.0f} s at {:.3g} cells/s\n".format(self.runtime, self.cells_per_second)
+        return s
+
+def estimate(em):
+    """ Estimate of one solve of em, generating it if needed """
+    report = em.mesh_report(1)
+    lines = [report.lines[d] for d in 'xyz']
+    cells = report.total_cells
+    memory = {'engine': engine_bytes * cells, 'setup': setup_bytes * cells}
+    pml = 0
+    for (i, bc) in enumerate(em.boundaries):
+        if str(bc).startswith('PML_'):
+            other = [report.cells[a] for a in range(3) if a != i // 2]
+            pml += int(str(bc)[4:]) * other[0] * other[1]
+    memory['pml'] = pml_bytes * pml
+    sheets = 0
+    for o in em.objects.values():
+        if getattr(getattr(o, 'material', None), 'lossy', False):
+            box = bounds(o)
+            if box:
+                sheets += cells_in(lines, *box)
+    memory['sheets'] = sheet_bytes * sheets
+    memory['dumps'] = dump_bytes * sum(cells_in(lines, lo, hi) for (lo, hi) in dump_boxes(em))
+    timesteps = int(em.NrTS)
+    if report.timestep:
+        size = np.sqrt(sum((l[-1] - l[0]) ** 2 for l in lines))
+        n = max([1.0] + [nr for (lo, hi, nr) in openems.AutoMesh().regions(em)])
+        tstart = 9.0 / (np.pi * 0.5 * (em.fmax - em.fmin))
+        t = tstart + transits * size * n / openems.c
+        timesteps = min(timesteps, int(np.ceil(t / report.timestep)))
+    speed = em.cells_per_second or calibrate.best_threads(cells)[1] or default_speed
+    return Estimate(cells, memory, timesteps, int(em.NrTS), speed)
+
+def memory_budget(em):
+    """
+    em.memory_budget in bytes, 'auto' being the RAM available now. Take it in
+    the parent before forking concurrent solves and set it in each child, so
+    the memory held by solves already running is not counted against it twice.
+    """
+    return available_memory() if em.memory_budget == 'auto' else em.memory_budget
+
+def admit(em, concurrent=1):
+    """
+    Raise with the estimate if concurrent solves of em would exceed
+    memory_budget(em) or one would exceed em.time_budget seconds. returns the Estimate.
+    """
+    e = estimate(em)
+    budget = memory_budget(em)
+    if budget and concurrent * e.peak > budget:
+        raise Exception("{} solve(s) need an estimated {:.1f} MB, over the {:.1f} MB memory budget\n{}".format(
+            concurrent, concurrent * e.peak / 1e6, budget / 1e6, e))
+    if em.time_budget and e.runtime > em.time_budget:
+        raise Exception("solve needs an estimated {:.3g} s, over the {:.3g} s time budget\n{}".format(
+            e.runtime, em.time_budget, e))
+    return e
@@ -0,0 +1,31 @@
+""" measure the time to import openems: python -m openems.importtime [module] [runs] """
+import sys, subprocess
+from openems.parallel import python_env
+
+def measure(module='openems', runs=5):
+    """
+    import module in a fresh interpreter runs times using python -X importtime
+    returns (best total seconds, [(cumulative seconds, name), ...] slowest first for that run)
+    """
+    env = python_env()
+    best = None
+    for i in range(runs):
+        r = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                           env=env, capture_output=True, text=True, check=True)
+        rows = []
+        for line in r.stderr.splitlines():
+            fields = line.split('|')
+            if not line.startswith('import time:') or len(fields) != 3 or 'cumulative' in line:
+                continue
+            rows.append((int(fields[1]) * 1e-6, fields[2].strip()))
+        total = max(t for (t, name) in rows if name == module)
+        if best is None or total < best[0]:
+            best = (total, sorted(rows, reverse=True))
+    return best
+
+if __name__ == "__main__":
+    module = sys.argv[1] if len(sys.argv) > 1 else 'openems'
+    total, rows = measure(module, int(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    print("import {}: {:.1f} ms".format(module, total * 1e3))
+    for (t, name) in rows[:15]:
+        print("{:10.1f} ms  {}".format(t * 1e3, name))
@@ -1,14 +1,45 @@
 # Copyright (C) 2005-2019 Darrell Harmon, David Carr, Peter Baxendale, Stephen Ecob, Larry Doolittle
 # GPLv3+
+import numpy as np
+
+def xy(points, mirror=""):
+    """ '\t(xy x y)\n' for each point, mirrored on a copy, formatted in one operation """
+    p = np.array(points, dtype=float)[:, :2]
+    if "x" in mirror:
+        p[:, 0] *= -1.0
+    if "y" in mirror:
+        p[:, 1] *= -1.0
+    return ("\t(xy %.6f %.6f)\n" * len(p)) % tuple(p.ravel())
 
 class Generator():
-    def __init__(self, part):
-        self.mirror = ""
-        self.fp = "(module {} (layer F.Cu)\n".format(part)
-        self.fp += "  (at 0 0)\n"
-        self.fp += "  (attr smd)"
-        self.fp += "  (fp_text reference U1 (at 0 -1.27) (layer F.SilkS) hide (effects (font (size 0.7 0.7) (thickness 0.127))))\n"
-        self.fp += "  (fp_text value value (at 0 1.27) (layer F.SilkS) hide (effects (font (size 0.7 0.7) (thickness 0.127))))\n"
+    """
+    KiCad footprint, written to out (a file) as it is built if given,
+    else collected and returned by finish()
+    """
+    def __init__(self, part, out=None, mirror=""):
+        self.mirror = mirror
+        self.out = out
+        self.chunks = []
+        self.write("(module {} (layer F.Cu)\n".format(part))
+        self.write("  (at 0 0)\n")
+        self.write("  (attr smd)")
+        self.write("  (fp_text reference U1 (at 0 -1.27) (layer F.SilkS) hide (effects (font (size 0.7 0.7) (thickness 0.127))))\n")
+        self.write("  (fp_text value value (at 0 1.27) (layer F.SilkS) hide (effects (font (size 0.7 0.7) (thickness 0.127))))\n")
+
+    def write(self, s):
+        if self.out:
+            self.out.write(s)
+        else:
+            self.chunks.append(s)
+
+    @property
+    def fp(self):
+        """ the footprint so far, when not writing to out """
+        return ''.join(self.chunks)
+
+    @fp.setter
+    def fp(self, s):
+        self.chunks = [s]
 
     # mm, degrees
     def add_pad(self,
@@ -40,39 +71,85 @@ class Generator():
             drillstring = " (drill {:.6f})".format(drill)
             padtype = "thru_hole"
             layers = " (layers *.Cu)"
-        self.fp += "  (pad {} {} {} {} (size {:.6f} {:.6f}){}".format(
-            name, padtype, shape, atstring, xsize, ysize, drillstring)
-        self.fp += layers
-        self.fp += ")\n"
+        self.write("  (pad {} {} {} {} (size {:.6f} {:.6f}){}{})\n".format(
+            name, padtype, shape, atstring, xsize, ysize, drillstring, layers))
 
     def add_polygon(self, points, layer="F.Cu", width = 0.0):
-        polystring = "(fp_poly (pts\n"
-        for p in points:
-            if "x" in self.mirror:
-                p[0] *= -1.0
-            if "y" in self.mirror:
-                p[1] *= -1.0
-            polystring += "\t(xy {:.6f} {:.6f})\n".format(p[0], p[1])
-        polystring += ") (layer {}) (width {:.6f}) )\n".format(layer, width)
-        self.fp += polystring
+        self.write("(fp_poly (pts\n" + xy(points, self.mirror) +
+                   ") (layer {}) (width {:.6f}) )\n".format(layer, width))
 
     def add_custom_pad(self, name, x, y, polygons, layer="F.Cu"):
-        self.fp += "(pad {} connect custom (at {} {}) (size 0.1 0.1) (layers {})\n".format(
-            name, x, y, layer)
-        self.fp += "(options (clearance outline) (anchor circle))\n"
-        self.fp += "(primitives\n"
+        self.write("(pad {} connect custom (at {} {}) (size 0.1 0.1) (layers {})\n".format(
+            name, x, y, layer))
+        self.write("(options (clearance outline) (anchor circle))\n")
+        self.write("(primitives\n")
         for polygon in polygons:
-            polygon -= [x,y]
-            self.fp += "(gr_poly (pts\n"
-            for p in polygon:
-                if "x" in self.mirror:
-                    p[0] *= -1.0
-                if "y" in self.mirror:
-                    p[1] *= -1.0
-                self.fp += "\t(xy {:.6f} {:.6f})\n".format(p[0], p[1])
-            self.fp += ") (width 0))\n"
-        self.fp += "))\n"
+            self.write("(gr_poly (pts\n" + xy(np.asarray(polygon) - [x, y], self.mirror) + ") (width 0))\n")
+        self.write("))\n")
 
     def finish(self):
-        self.fp += ")\n"
-        return self.fp
+        self.write(")\n")
+        return None if self.out else self.fp
+
+class Generators():
+    """ several footprints of the same objects in one pass, each call goes to every generator """
+    def __init__(self, generators):
+        self.generators = generators
+
+    def __getattr__(self, name):
+        calls = [getattr(g, name) for g in self.generators]
+        return lambda *args, **kwargs: [call(*args, **kwargs) for call in calls]
+
+def write(objects, footprints):
+    """
+    stream the footprints of objects (each with generate_kicad(g)) to their
+    files in one pass over the objects
+    footprints: [(filename, part, mirror)]
+    """
+    files = [open(filename, "w") for (filename, part, mirror) in footprints]
+    try:
+        g = Generators([Generator(part, f, mirror) for (f, (filename, part, mirror)) in zip(files, footprints)])
+        for o in objects:
+            o.generate_kicad(g)
+        g.finish()
+    finally:
+        for f in files:
+            f.close()
+
+class Hash():
+    """
+    Generator stand in hashing the footprint geometry: the calls and their
+    arguments, independent of the part name and number formatting
+    """
+    def __init__(self):
+        import hashlib
+        self.h = hashlib.sha256()
+
+    def update(self, x):
+        if isinstance(x, (list, tuple)):
+            self.h.update(b'[%d' % len(x))
+            for v in x:
+                self.update(v)
+        elif isinstance(x, np.ndarray):
+            self.h.update(repr(x.shape).encode() + np.ascontiguousarray(x, dtype=float).tobytes())
+        else:
+            self.h.update(repr(float(x) if isinstance(x, np.number) else x).encode())
+
+    def add_pad(self, *args, **kwargs):
+        self.update(['pad', args, sorted(kwargs.items())])
+
+    def add_polygon(self, *args, **kwargs):
+        self.update(['polygon', args, sorted(kwargs.items())])
+
+    def add_custom_pad(self, *args, **kwargs):
+        self.update(['custom_pad', args, sorted(kwargs.items())])
+
+    def hexdigest(self):
+        return self.h.hexdigest()
+
+def geometry_hash(objects):
+    """ sha256 of the KiCad geometry of objects, see Hash """
+    h = Hash()
+    for o in objects:
+        o.generate_kicad(h)
+    return h.hexdigest()
@@ -0,0 +1,283 @@
+import numpy as np
+import openems
+
+def unique_lines(lines, tolerance):
+    """ sorted lines with any within tolerance of the previous kept line removed """
+    rv = []
+    for x in np.sort(lines):
+        if not rv or x - rv[-1] > tolerance:
+            rv.append(x)
+    return np.array(rv)
+
+def merge_lines(lines, tolerance, preferred=[]):
+    """
+    Merge clusters of lines spanning no more than tolerance into one line.
+    Each cluster snaps to a preferred line if it contains one, otherwise to the
+    line added most often (duplicates in lines count), then the first.
+    returns (merged lines, number of lines removed)
+    """
+    values, counts = np.unique(np.asarray(lines, dtype=float), return_counts=True)
+    preferred = np.asarray(preferred, dtype=float)
+    rv = []
+    i = 0
+    while i < len(values):
+        j = i + 1
+        while j < len(values) and values[j] - values[i] <= tolerance:
+            j += 1
+        cluster = values[i:j]
+        weight = counts[i:j] + len(values) * np.isin(cluster, preferred)
+        rv.append(cluster[np.argmax(weight)])
+        i = j
+    return np.array(rv), len(values) - len(rv)
+
+def pieces(a, b, ha, hb, m, s):
+    """
+    [(x0, x1, h(x0), slope)] of the cell density h(x) = min(m, ha + s (x - a), hb + s (b - x))
+    on [a, b], each piece linear
+    """
+    xa = a + (m - ha) / s # the rising ramp reaches m
+    xb = b - (m - hb) / s # the falling ramp leaves m
+    if xa <= xb:
+        cuts = [(a, s), (xa, 0), (xb, -s)]
+    else:
+        cuts = [(a, s), ((hb - ha + s * (a + b)) / (2 * s), -s)]
+    rv = []
+    for (k, (x0, slope)) in enumerate(cuts):
+        x0 = min(max(x0, a), b)
+        x1 = min(max(cuts[k+1][0], a), b) if k + 1 < len(cuts) else b
+        if x1 > x0:
+            rv.append((x0, x1, min(m, ha + s * (x0 - a), hb + s * (b - x0)), slope))
+    return rv
+
+def count(piece):
+    """ cells in a piece of pieces(), the integral of 1 / h """
+    (x0, x1, h0, slope) = piece
+    if slope == 0:
+        return (x1 - x0) / h0
+    return np.log((h0 + slope * (x1 - x0)) / h0) / slope
+
+def place(a, b, ha, hb, m, s, n):
+    """ the n - 1 lines splitting the density of pieces() into n whole cells """
+    rv = []
+    c = 0.0 # cells before the current piece
+    k = 1
+    for piece in pieces(a, b, ha, hb, m, s):
+        (x0, x1, h0, slope) = piece
+        dc = count(piece)
+        while k < n and k <= c + dc:
+            u = k - c
+            if slope == 0:
+                rv.append(x0 + u * h0)
+            else:
+                rv.append(x0 + h0 * (np.exp(slope * u) - 1) / slope)
+            k += 1
+        c += dc
+    return np.array(rv[:n-1])
+
+def grade(a, b, ha, hb, hmax, ratio):
+    """
+    lines strictly between a and b, cell size starting at ha at a and
+    hb at b, growing by ratio per cell up to hmax
+    The cell density h(x) has a slope of log(ratio) from each end, so cells
+    are h(x) log(ratio) / (ratio - 1) wide where h(x) is the density at their
+    start, and adjacent cells differ by at most ratio, also across a from a
+    neighbouring grade() with the same ha. A fractional number of cells is
+    rounded up by lowering the cap below hmax, which leaves the end cells
+    alone unless the gap is too short for them; then the end cells are
+    instead grown to make one cell fewer if that changes them less, by no
+    more than ratio and within hmax.
+    """
+    s = np.log(ratio)
+    ha, hb = [min(h, hmax) * s / (ratio - 1) for h in (ha, hb)] # densities for those first cells
+    total = lambda m, k=1.0: sum(count(p) for p in pieces(a, b, k * ha, k * hb, m, s))
+    n = max(1, int(np.ceil(total(hmax) - 1e-9)))
+    lo, hi = 0.0, hmax # total() falls as the cap m rises
+    for i in range(100):
+        m = 0.5 * (lo + hi)
+        if total(m) > n:
+            lo = m
+        else:
+            hi = m
+    squeeze = max(ha, hb) / min(hi, max(ha, hb)) # how much the cap shrinks the end cells
+    if n > 1 and total(hmax * ratio, ratio) <= n - 1:
+        lo, k = 1.0, ratio # total() falls as the end cells grow by k
+        for i in range(100):
+            if total(hmax * ratio, 0.5 * (lo + k)) > n - 1:
+                lo = 0.5 * (lo + k)
+            else:
+                k = 0.5 * (lo + k)
+        rv = place(a, b, k * ha, k * hb, hmax * ratio, s, n - 1)
+        if k < squeeze and np.max(np.diff(np.concatenate([[a], rv, [b]]))) <= hmax * (1 + 1e-9):
+            return rv
+    if n == 1:
+        return np.zeros(0)
+    return place(a, b, ha, hb, hi, s, n)
+
+class AutoMesh():
+    """
+    Frequency aware mesh, used by OpenEMS.generate() when em.resolution = 'auto'.
+    The maximum cell size in each region is the shortest wavelength at fmax in the
+    densest Dielectric over that region divided by cells_per_wavelength, and no more
+    than 1/layer_cells of the thickness of any Dielectric there. Metal edges
+    in x and y get fine cells using the thirds rule (1/3 cell inside the metal,
+    2/3 outside), metal faces in z get a line at the face. Cells are graded by about
+    ratio between the fine and coarse regions.
+    edge_resolution: fine cell size, default is the smaller of 1/4 of the smallest
+    maximum cell size and 1/3 of the smallest metal feature (1x in z), a feature
+    being the distance between two edges of one object, but at least min_cell
+    (and 4x tolerance) so nearly coincident edges do not make sliver cells
+    tolerance: edges closer than this to a mesh line snap to it, default em.mesh_tolerance
+    scale: multiplies every cell size above, see convergence.refine()
+    """
+    def __init__(self, cells_per_wavelength=20, edge_resolution=None, ratio=1.4, tolerance=None, scale=1.0,
+                 min_cell=5e-6, layer_cells=3):
+        self.cells_per_wavelength = cells_per_wavelength
+        self.layer_cells = layer_cells
+        self.edge_resolution = edge_resolution
+        self.min_cell = min_cell
+        self.ratio = ratio
+        self.tolerance = tolerance
+        self.scale = scale
+
+    def regions(self, em):
+        """ [(lo[3], hi[3], refractive index)] of each dielectric object """
+        rv = []
+        for o in em.objects.values():
+            material = getattr(o, 'material', None)
+            if getattr(material, 'type', None) != 'dielectric':
+                continue
+            edges = np.array([(a, x) for (a, x, side) in o.edges()], dtype=float)
+            if len(edges) == 0:
+                continue
+            lo = [np.min(edges[edges[:,0] == a, 1]) for a in range(3)]
+            hi = [np.max(edges[edges[:,0] == a, 1]) for a in range(3)]
+            rv.append((lo, hi, np.sqrt(material.eps_r * material.ur)))
+        return rv
+
+    def max_cell(self, em, regions, axis, x):
+        """ maximum cell size at coordinate x, using the projection of each region on axis """
+        n = 1.0
+        for (lo, hi, nr) in regions:
+            if lo[axis] <= x <= hi[axis]:
+                n = max(n, nr)
+        return self.scale * openems.c / (em.fmax * n) / self.cells_per_wavelength
+
+    def layer_cell(self, regions, axis, x):
+        """ maximum cell size at coordinate x for layer_cells across each region there """
+        return self.scale * min([(hi[axis] - lo[axis]) / self.layer_cells
+                                 for (lo, hi, nr) in regions if lo[axis] <= x <= hi[axis]] + [np.inf])
+
+    def metal_edges(self, em, axis, existing, tolerance):
+        """
+        ({coordinate: side}, smallest feature) for the metal (non dielectric)
+        objects and ports, side is 0 in z, where sides conflict or where none is known
+        vertices without a side (None) are left to the graded mesh
+        coordinates within tolerance of an existing line are moved to it
+        the smallest feature is the closest pair of edges of any one object, None without
+        """
+        sides = {}
+        feature = None
+        for o in em.objects.values():
+            material = getattr(o, 'material', None)
+            if getattr(material, 'type', None) == 'dielectric':
+                continue
+            xs = []
+            for (a, x, side) in o.edges():
+                if a != axis or side is None:
+                    continue
+                x = float(x)
+                if len(existing):
+                    nearest = existing[np.argmin(np.abs(existing - x))]
+                    if abs(nearest - x) <= tolerance:
+                        x = float(nearest)
+                sides.setdefault(x, set()).add(side)
+                xs.append(x)
+            xs = unique_lines(xs, tolerance)
+            if len(xs) > 1:
+                feature = min(feature or np.inf, np.min(np.diff(xs)))
+        edges = {}
+        for (x, s) in sides.items():
+            s.discard(0)
+            edges[x] = s.pop() if len(s) == 1 and axis != 2 else 0
+        return edges, feature
+
+    def lines(self, em, axis, existing, regions):
+        tolerance = self.tolerance if self.tolerance is not None else (em.mesh_tolerance or 0)
+        edges, feature = self.metal_edges(em, axis, existing, tolerance)
+        hmin = min([self.max_cell(em, regions, axis, x) for x in existing] +
+                   [self.max_cell(em, regions, axis, x) for x in edges])
+        if self.edge_resolution is not None:
+            fine = self.scale * self.edge_resolution
+        else:
+            fine = 0.25 * hmin
+            if feature:
+                fine = min(fine, self.scale * feature / (1.0 if axis == 2 else 3.0))
+            fine = max(fine, self.scale * self.min_cell, 4 * tolerance)
+        # edges of different objects closer than half a fine cell are one edge
+        clustered = {}
+        for x in sorted(edges):
+            if clustered and x - max(clustered) < 0.5 * fine:
+                last = max(clustered)
+                clustered[last] = clustered[last] if clustered[last] == edges[x] else 0
+            else:
+                clustered[x] = edges[x]
+        edges = clustered
+        lo = min(list(existing) + list(edges))
+        hi = max(list(existing) + list(edges))
+        # fixed lines and the cell size wanted next to them
+        fixed = {}
+        for (x, side) in edges.items():
+            if side == 0 or not (lo <= x - side * 2.0 * fine / 3.0 <= hi):
+                fixed[x] = fine
+            else:
+                fixed[x + side * fine / 3.0] = fine
+                fixed[x - side * 2.0 * fine / 3.0] = fine
+        for x in existing:
+            x = float(x)
+            if edges.get(x, 0) != 0 and x not in fixed: # replaced by the thirds rule lines
+                continue
+            if x not in fixed:
+                fixed[x] = self.max_cell(em, regions, axis, x)
+        xs = unique_lines(list(fixed), 0.5 * fine)
+        # the maximum cell of the gap after each fixed line, the cell wanted at a
+        # line is no larger than that on either side
+        mid = 0.5 * (xs[1:] + xs[:-1])
+        hmax = [min(self.max_cell(em, regions, axis, x), self.layer_cell(regions, axis, x)) for x in mid]
+        h = [min([fixed.get(x, fine)] + hmax[max(0, i-1):i+1]) for (i, x) in enumerate(xs)]
+        # the size wanted at a line is at most what grade() grows to from either
+        # neighbour, so the grading holds across closely spaced fixed lines
+        for order in [range(1, len(xs)), range(len(xs) - 2, -1, -1)]:
+            for i in order:
+                j = i - 1 if order.step == 1 else i + 1
+                h[i] = min(h[i], h[j] + (self.ratio - 1) * abs(xs[i] - xs[j]))
+        # grade() holds the ratio within each gap and across a fixed line where
+        # both gaps start with the cell wanted there, which a gap too short for
+        # it does not: shrink the cell wanted at such a line until the cells
+        # agree, but not below min_cell
+        floor = max(self.scale * self.min_cell, 4 * tolerance)
+        for iteration in range(100):
+            rv = [xs[:1]]
+            at = [0] # index of each fixed line in the result
+            for i in range(len(xs) - 1):
+                rv.append(grade(xs[i], xs[i+1], h[i], h[i+1], hmax[i], self.ratio))
+                rv.append(xs[i+1:i+2])
+                at.append(at[-1] + len(rv[-2]) + 1)
+            cells = np.diff(np.concatenate(rv))
+            bad = [(i, k) for (i, k) in enumerate(at) if 0 < k < len(cells) and
+                   max(cells[k-1], cells[k]) > self.ratio * (1 + 1e-9) * min(cells[k-1], cells[k])]
+            if not [i for (i, k) in bad if h[i] > floor]:
+                break
+            for (i, k) in bad:
+                h[i] = max(floor, min(h[i], cells[k-1], cells[k]) / np.sqrt(self.ratio))
+        for (i, k) in bad:
+            print("mesh {}: cells {:.4g} and {:.4g} m at {:.6g} m differ by more than the ratio {}".format(
+                'xyz'[axis], cells[k-1], cells[k], xs[i], self.ratio))
+        return np.concatenate(rv)
+
+    def apply(self, em):
+        """ replace the mesh lines of em, call after the objects are generated """
+        regions = self.regions(em)
+        for axis in range(3):
+            d = 'xyz'[axis]
+            existing = em.mesh.GetLines(d, do_sort=True)
+            em.mesh.SetLines(d, self.lines(em, axis, existing, regions))
@@ -0,0 +1,58 @@
+import os
+
+def _call(fn, job, conn):
+    try:
+        conn.send((True, fn(job)))
+    except Exception as e:
+        conn.send((False, e))
+    conn.close()
+
+def fork_map(fn, jobs, nprocesses=None):
+    """
+    [fn(job) for job in jobs], each call in a newly forked process, at most
+    nprocesses at once (default the number of cores).
+    fn and the jobs are inherited by the fork so they need not be picklable,
+    the return values are pickled. Each call gets a fresh copy of this process,
+    which matters since an OpenEMS instance can only generate its CSX once.
+    The processes are not daemonic, so fn may fork again.
+    """
+    import multiprocessing, multiprocessing.connection
+    context = multiprocessing.get_context('fork')
+    if nprocesses is None:
+        nprocesses = os.cpu_count() or 1
+    results = [None] * len(jobs)
+    pending = list(range(len(jobs)))
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < max(1, nprocesses):
+                i = pending.pop(0)
+                r, w = context.Pipe(duplex=False)
+                p = context.Process(target=_call, args=(fn, jobs[i], w))
+                p.start()
+                w.close()
+                running[r] = (i, p)
+            for r in multiprocessing.connection.wait(list(running)):
+                i, p = running.pop(r)
+                try:
+                    ok, value = r.recv()
+                except EOFError:
+                    ok, value = False, Exception("job {} exited with code {}".format(i, p.exitcode))
+                r.close()
+                p.join()
+                if not ok:
+                    raise value
+                results[i] = value
+    finally:
+        for (i, p) in running.values():
+            p.terminate()
+            p.join()
+    return results
+
+def python_env():
+    """ os.environ with PYTHONPATH set so a new interpreter can import openems """
+    # the directory containing the openems package, which may be a symlink
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([path] + [p for p in [env.get('PYTHONPATH')] if p])
+    return env
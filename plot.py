@@ -0,0 +1,68 @@
+import os, sys, subprocess
+import numpy as np
+from openems.parallel import python_env
+
+def plot_s(f, s, basename, formats=['png', 'svg', 'pdf'], xgrid=None, ygrid=None,
+           legend_location=2, show=False):
+    """
+    plot dB(s[i]) vs frequency and save basename.<format> for each of formats
+    s: list of s[i1]
+    show: display with pyplot, otherwise render without a display backend
+    the figure is always closed before returning
+    """
+    if show:
+        import matplotlib.pyplot
+        fig = matplotlib.pyplot.figure()
+    else:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        FigureCanvasAgg(fig)
+    try:
+        ax = fig.subplots()
+        nports = len(s)
+        if nports > 1:
+            ax.plot(f/1e9, 20*np.log10(np.abs(s[1])), label = 'dB(s21)')
+        ax.plot(f/1e9, 20*np.log10(np.abs(s[0])), label = 'dB(s11)')
+        if nports > 2:
+            for i in range(2,nports):
+                ax.plot(f/1e9, 20*np.log10(np.abs(s[i])), label = f'dB(s{i+1}1)')
+
+        ax.set_xlabel('Frequency (GHz)')
+        ax.set_ylabel('dB')
+        if hasattr(xgrid, "__len__"):
+            ax.set_xticks(xgrid)
+        if hasattr(ygrid, "__len__"):
+            ax.set_yticks(ygrid)
+        ax.grid(True)
+        fig.tight_layout()
+        ax.legend(loc=legend_location)
+        for fmt in formats:
+            fig.savefig(basename + "." + fmt)
+        if show:
+            matplotlib.pyplot.show()
+    finally:
+        if show:
+            matplotlib.pyplot.close(fig)
+
+def defer(f, s, basename, formats=['png', 'svg', 'pdf'], xgrid=None, ygrid=None, legend_location=2):
+    """
+    save the results to basename_s.npz and render them in a separate lowest
+    priority process, returns that process without waiting for it
+    """
+    npz = basename + "_s.npz"
+    np.savez(npz, f=f, s=np.array(s), basename=basename, formats=np.array(formats, dtype=str),
+             xgrid=np.array(xgrid if hasattr(xgrid, "__len__") else []),
+             ygrid=np.array(ygrid if hasattr(ygrid, "__len__") else []),
+             legend_location=legend_location)
+    return subprocess.Popen([sys.executable, '-c', 'import sys, openems.plot; openems.plot.render(sys.argv[1])', npz],
+                            env=python_env(),
+                            stdin=subprocess.DEVNULL, preexec_fn=lambda: os.nice(19))
+
+def render(npz):
+    """ render a plot saved by defer() """
+    with np.load(npz) as d:
+        plot_s(d['f'], list(d['s']), str(d['basename']), list(d['formats']),
+               d['xgrid'] if len(d['xgrid']) else None,
+               d['ygrid'] if len(d['ygrid']) else None,
+               d['legend_location'].item())
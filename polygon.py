@@ -51,6 +51,32 @@ class Polygon(openems.Object):
         else:
             g.add_polygon(points = 1000.0 * self.points, layer = self.pcb_layer, width=0)
 
+    def edges(self):
+        """
+        axis aligned polygon sides and the bounding box are sided, vertices of
+        other sides have side None: they get no mesh line of their own
+        """
+        axes = {'x': [1, 2, 0], 'y': [0, 2, 1], 'z': [0, 1, 2]}[self.normal_direction]
+        p = self.points
+        q = np.roll(p, -1, axis=0)
+        # +1 for counterclockwise, the interior is then left of each side
+        ccw = np.sign(np.sum(p[:,0]*q[:,1] - q[:,0]*p[:,1]))
+        edges = []
+        for (a, b) in zip(p, q):
+            d = b - a
+            if d[1] == 0:
+                edges.append((axes[1], a[1], int(np.sign(d[0]) * ccw)))
+            elif d[0] == 0:
+                edges.append((axes[0], a[0], int(-np.sign(d[1]) * ccw)))
+            else:
+                edges.append((axes[0], a[0], None))
+                edges.append((axes[1], a[1], None))
+        for i in range(2):
+            edges += [(axes[i], np.min(p[:,i]), 1), (axes[i], np.max(p[:,i]), -1)]
+        lo, hi = sorted(self.elevation)
+        edges += [(axes[2], lo, 0), (axes[2], hi, 0)]
+        return edges
+
     def generate_octave(self):
         height = self.elevation[1] - self.elevation[0]
         self.material.material.AddLinPoly(np.swapaxes(self.points, 0, 1),
@@ -0,0 +1,110 @@
+"""
+binary storage of the port probe files openEMS writes to the sim path:
+each probe is kept as a float64 .npy array in <simpath>/probes that load()
+memory maps without parsing, next to a small probes.json header
+python -m openems.probes <simpath> converts the text probes of an existing sim path
+"""
+import os, sys, json, shutil, itertools
+import numpy as np
+
+archive_dir = 'probes'
+header_name = 'probes.json'
+
+def probe_files(simpath, prefix='port_'):
+    """ names of the port voltage and current probe text files in simpath """
+    if not os.path.isdir(simpath):
+        return []
+    return sorted(n for n in os.listdir(simpath)
+                  if n.startswith(prefix) and os.path.isfile(os.path.join(simpath, n)))
+
+def convert_file(src, dst, chunk=65536):
+    """
+    convert the text probe src to float64 .npy dst reading it once, chunk
+    lines at a time so long probes never need to fit in memory as text: the
+    rows go to a raw file behind dst's header once their number is known
+    returns the array, memory mapped
+    """
+    raw = dst + '.raw'
+    shape = [0, 0]
+    with open(src) as f, open(raw, 'wb') as out:
+        lines = (line for line in f if line.strip() and not line.startswith('%'))
+        for block in iter(lambda: list(itertools.islice(lines, chunk)), []):
+            a = np.loadtxt(block, dtype=np.float64, ndmin=2)
+            out.write(a.tobytes())
+            shape = [shape[0] + len(a), a.shape[1]]
+    with open(raw, 'rb') as f, open(dst, 'wb') as out:
+        np.lib.format.write_array_header_1_0(out, {'descr': '<f8', 'fortran_order': False, 'shape': tuple(shape)})
+        shutil.copyfileobj(f, out)
+    os.remove(raw)
+    return np.load(dst, mmap_mode='r')
+
+def archive(simpath, scene='', remove=True):
+    """
+    Convert the probe files of simpath into simpath/probes, with a header
+    of the scene_hash() they were solved for and each probe's sample count
+    and time step.
+    remove: delete the text files afterwards
+    returns the header
+    """
+    d = os.path.join(simpath, archive_dir)
+    os.makedirs(d, exist_ok=True)
+    header = {'scene': scene, 'probes': {}}
+    for n in probe_files(simpath):
+        a = convert_file(os.path.join(simpath, n), os.path.join(d, n + '.npy'))
+        t = a[:, 0]
+        header['probes'][n] = {'samples': len(a), 'columns': a.shape[1],
+                               't0': float(t[0]) if len(t) else 0.0,
+                               'dt': float((t[-1] - t[0]) / (len(t) - 1)) if len(t) > 1 else 0.0}
+        del a
+        if remove:
+            os.remove(os.path.join(simpath, n))
+    with open(os.path.join(d, header_name), 'w') as f:
+        json.dump(header, f, indent=1)
+    return header
+
+def header(simpath):
+    """ the header written by archive(), or None """
+    try:
+        with open(os.path.join(simpath, archive_dir, header_name)) as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+def load(simpath, name):
+    """ probe name as a read only memory mapped array of rows (t, value, ...) """
+    return np.load(os.path.join(simpath, archive_dir, name + '.npy'), mmap_mode='r')
+
+def load_all(simpath):
+    """ {name: load(simpath, name)} for every archived probe """
+    h = header(simpath)
+    return {n: load(simpath, n) for n in (h['probes'] if h else [])}
+
+def check(simpath, scene=''):
+    """ raises unless simpath has probe data, solved for scene if given """
+    h = header(simpath)
+    if h is None:
+        if probe_files(simpath):
+            return
+        raise Exception("no probe data in {}, solve first".format(simpath))
+    if scene and h['scene'] and h['scene'] != scene:
+        raise Exception("probe data in {} was solved for a different scene".format(simpath))
+
+def restore(simpath, scene=''):
+    """
+    Write the archived probes back as text files for CalcPort where they
+    are missing, see check().
+    returns the filenames written
+    """
+    check(simpath, scene)
+    written = []
+    for (n, a) in load_all(simpath).items():
+        path = os.path.join(simpath, n)
+        if not os.path.exists(path):
+            np.savetxt(path, a, header='restored from ' + archive_dir, comments='% ')
+            written.append(path)
+    return written
+
+if __name__ == "__main__":
+    for simpath in sys.argv[1:]:
+        h = archive(simpath, remove=False)
+        print("{}: {} probes".format(simpath, len(h['probes'])))
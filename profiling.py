@@ -0,0 +1,105 @@
+"""
+wall time and memory of each phase of a run, see OpenEMS.profile_path
+and OpenEMS.profile_hook
+"""
+import os, sys, re, time, json, socket, threading, resource
+
+def rss():
+    """ (current, peak) resident memory of this process in bytes """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'), peak
+    except OSError:
+        return peak, peak
+
+class Phase():
+    """ context manager appending {phase, seconds, rss, peak_rss, ...} to a Profile """
+    def __init__(self, profile, name, info):
+        self.profile = profile
+        self.record = dict(phase=name, **info)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc):
+        self.record['seconds'] = time.perf_counter() - self.start
+        self.record['rss'], self.record['peak_rss'] = rss()
+        self.profile.phases.append(self.record)
+        return False
+
+class Profile():
+    """ the phases of one run, in the order they finished """
+    def __init__(self):
+        self.start = time.time()
+        self.phases = []
+
+    def phase(self, name, **info):
+        """ with profile.phase('run', port=0) as record: ... """
+        return Phase(self, name, info)
+
+    def extend(self, phases, **info):
+        """ add the phases from a forked solve, tagged with info """
+        self.phases += [dict(p, **info) for p in phases]
+
+    def record(self, name, **info):
+        """ the JSON record of the run """
+        return dict(name=name, host=socket.gethostname(), pid=os.getpid(), start=self.start,
+                    seconds=time.time() - self.start, peak_rss=rss()[1], phases=self.phases, **info)
+
+def write(record, path):
+    """ append record as one JSON line """
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default=float) + '\n')
+
+def parse_engine(text):
+    """ {timesteps, cells, engine_seconds, mcells_per_second} found in openEMS output """
+    rv = {}
+    m = re.search(r'Time for (\d+) iterations with ([\d.e+]+) cells\s*:\s*([\d.e+]+) sec', text)
+    if m:
+        rv['timesteps'] = int(m.group(1))
+        rv['cells'] = float(m.group(2))
+        rv['engine_seconds'] = float(m.group(3))
+    m = re.search(r'Speed:\s*([\d.e+]+) MC/s', text)
+    if m:
+        rv['mcells_per_second'] = float(m.group(1))
+    return rv
+
+class Tee():
+    """
+    copy everything written to file descriptor fd (default stdout, including
+    output from the openEMS library) while active, keeping it on the terminal
+    text: what was written
+    """
+    def __init__(self, fd=1):
+        self.fd = fd
+        self.text = ''
+
+    def __enter__(self):
+        sys.stdout.flush()
+        self.saved = os.dup(self.fd)
+        r, w = os.pipe()
+        os.dup2(w, self.fd)
+        os.close(w)
+        chunks = []
+        def copy():
+            while True:
+                data = os.read(r, 65536)
+                if not data:
+                    break
+                os.write(self.saved, data)
+                chunks.append(data)
+            os.close(r)
+        self.chunks = chunks
+        self.thread = threading.Thread(target=copy, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout.flush()
+        os.dup2(self.saved, self.fd) # closes the last write end of the pipe
+        self.thread.join()
+        os.close(self.saved)
+        self.text = b''.join(self.chunks).decode(errors='replace')
+        return False
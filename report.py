@@ -0,0 +1,49 @@
+import numpy as np
+import openems
+
+class MeshReport():
+    """
+    Summary of a generated mesh, see OpenEMS.mesh_report()
+    lines: {'x': lines, ...}
+    cells: cells per axis
+    total_cells
+    timestep: Courant limit estimate from the smallest cell in each axis, seconds
+    smallest: {'x': [(size, lo, hi, [object names]), ...], ...}, smallest first
+    """
+    def __init__(self, lines, smallest):
+        self.lines = lines
+        self.cells = [max(0, len(lines[d]) - 1) for d in 'xyz']
+        self.total_cells = int(np.prod(self.cells))
+        self.smallest = smallest
+        dmin = [smallest[d][0][0] for d in 'xyz' if smallest[d]]
+        self.timestep = 1.0 / (openems.c * np.sqrt(np.sum(1.0 / np.square(dmin)))) if len(dmin) == 3 else None
+
+    def __str__(self):
+        s = "cells: {} x {} x {} = {}\n".format(*self.cells, self.total_cells)
+        if self.timestep:
+            s += "timestep: {:.4g} s\n".format(self.timestep)
+        for d in 'xyz':
+            for (size, lo, hi, names) in self.smallest[d]:
+                s += "  {} {:.4g} m at [{:.6g}, {:.6g}]: {}\n".format(d, size, lo, hi, ' '.join(names))
+        return s
+
+def mesh_report(em, nsmallest=5):
+    """
+    Report on the mesh of em, which must be generated. Each of the nsmallest
+    cells in each axis lists the objects with an edge within one cell of it.
+    """
+    edges = {name: o.edges() for (name, o) in em.objects.items()}
+    lines = {}
+    smallest = {}
+    for axis in range(3):
+        d = 'xyz'[axis]
+        lines[d] = np.asarray(em.mesh.GetLines(d, do_sort=True), dtype=float)
+        size = np.diff(lines[d])
+        smallest[d] = []
+        for i in np.argsort(size, kind='stable')[:nsmallest]:
+            lo = lines[d][i]
+            hi = lines[d][i+1]
+            names = [name for (name, e) in edges.items()
+                     if any(a == axis and lo - size[i] <= x <= hi + size[i] for (a, x, side) in e)]
+            smallest[d].append((size[i], lo, hi, names))
+    return MeshReport(lines, smallest)
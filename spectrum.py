@@ -0,0 +1,112 @@
+"""
+spectra of probe time series without a per frequency DFT:
+czt() on any uniform grid (a dense one from 0 Hz included, at the
+requested frequencies rather than a zero padded FFT's) and dft()
+choosing between czt() and a direct sum for arbitrary frequencies
+"""
+import os
+import numpy as np
+
+def uniform(x, rtol=1e-6):
+    """ True if x has at least 2 points evenly spaced within rtol of the step """
+    if len(x) < 2:
+        return False
+    d = np.diff(x)
+    step = (x[-1] - x[0]) / (len(x) - 1)
+    return step != 0 and np.all(np.abs(d - step) <= rtol * abs(step))
+
+def scale(t, signal_type='pulse'):
+    """ the single sided spectrum scale used by openEMS DFT_time2freq() """
+    if signal_type == 'periodic':
+        return 2.0 / len(t)
+    return 2.0 * (t[1] - t[0])
+
+def czt(t, x, f0, df, m, signal_type='pulse'):
+    """
+    spectrum of uniformly sampled x(t) at f0 + k df for k < m by the chirp-z
+    transform (Bluestein), O((T + m) log(T + m)) for any f0 and df
+    """
+    n = len(x)
+    dt = (t[-1] - t[0]) / (n - 1)
+    theta = df * dt # cycles per n k
+    size = 1 << (n + m - 2).bit_length()
+    k = np.arange(max(n, m), dtype=float)
+    chirp = np.exp(-1j * np.pi * theta * k * k)
+    y = x * np.exp(-2j * np.pi * f0 * dt * k[:n]) * chirp[:n]
+    v = np.zeros(size, dtype=complex)
+    v[:m] = np.conj(chirp[:m])
+    v[size-n+1:] = np.conj(chirp[1:n][::-1])
+    g = np.fft.ifft(np.fft.fft(y, size) * np.fft.fft(v))[:m]
+    fk = f0 + df * k[:m]
+    return scale(t, signal_type) * chirp[:m] * g * np.exp(-2j * np.pi * fk * t[0])
+
+def direct(t, x, f, signal_type='pulse', chunk=1 << 22):
+    """ sum(x exp(-j 2 pi f t)) as a matrix product, chunk elements at a time """
+    f = np.asarray(f, dtype=float)
+    rv = np.empty(len(f), dtype=complex)
+    rows = max(1, chunk // max(1, len(t)))
+    for i in range(0, len(f), rows):
+        rv[i:i+rows] = np.exp(-2j * np.pi * np.outer(f[i:i+rows], t)) @ x
+    return scale(t, signal_type) * rv
+
+def dft(t, x, f, signal_type='pulse'):
+    """
+    same result as openEMS DFT_time2freq(t, x, f): czt() when both t and f
+    are uniform, otherwise direct()
+    """
+    f = np.atleast_1d(np.asarray(f, dtype=float))
+    if uniform(t) and uniform(f):
+        return czt(t, x, f[0], (f[-1] - f[0]) / (len(f) - 1), len(f), signal_type)
+    return direct(t, x, f, signal_type)
+
+class UIData():
+    """
+    Drop in for openEMS.ports.UI_data using dft() and reading probes archived
+    by probes.archive() memory mapped, as solves with keep_probes archive them
+    before the port calculation. Only a sim path never archived (keep_probes
+    off or an older solve) has its text files parsed, once.
+    """
+    def __init__(self, fns, path, freq, signal_type='pulse'):
+        from openems import probes
+        if isinstance(fns, str):
+            fns = [fns]
+        archived = (probes.header(path) or {}).get('probes', {})
+        self.path = path
+        self.fns = fns
+        self.freq = np.atleast_1d(freq)
+        self.ui_time = []
+        self.ui_val = []
+        self.ui_f_val = []
+        for fn in fns:
+            if fn in archived:
+                d = probes.load(path, fn)
+            else:
+                d = np.loadtxt(os.path.join(path, fn), comments='%', ndmin=2)
+            self.ui_time.append(d[:, 0])
+            self.ui_val.append(d[:, 1])
+            self.ui_f_val.append(dft(d[:, 0], d[:, 1], self.freq, signal_type))
+
+def calc_ports(ports, simpath, f, z, profile=None):
+    """
+    CalcPort for each of the openEMS ports with UIData reading the probes,
+    each timed as a phase of profile if given
+    returns False without calculating if the openEMS bindings have no UI_data to replace
+    """
+    try:
+        import openEMS.ports as module
+    except ImportError:
+        return False
+    if not hasattr(module, 'UI_data'):
+        return False
+    saved = module.UI_data
+    module.UI_data = UIData
+    try:
+        for (i, p) in enumerate(ports):
+            if profile:
+                with profile.phase('calc_port', port=i, frequencies=len(f)):
+                    p.CalcPort(simpath, f, ref_impedance=z)
+            else:
+                p.CalcPort(simpath, f, ref_impedance=z)
+    finally:
+        module.UI_data = saved
+    return True
@@ -0,0 +1,118 @@
+import os, json, itertools
+import numpy as np
+from .parallel import fork_map
+from . import calibrate, estimate, kicadfpwriter
+
+def _run_point(builder, index, params, z, numThreads, all_ports, nprocesses, available):
+    em = builder(**params)
+    em.concurrent = nprocesses
+    if em.memory_budget == 'auto': # RAM available before the batch started
+        em.memory_budget = available
+    em.simpath = em.get_simpath() + '_sweep{}'.format(index)
+    f = np.linspace(em.fmin, em.fmax, em.fsteps)
+    if all_ports:
+        s = em.solve_all_ports(f, z=z, numThreads=numThreads)
+    else:
+        if not os.path.exists(em.simpath):
+            os.mkdir(em.simpath)
+        s = em.solve_excitation(0, em.simpath, f, z, numThreads)
+    return f, s
+
+class SweepResult():
+    """
+    s-parameters labelled by sweep parameter
+    dims: parameter names followed by 'f', 'i' and, for all_ports, 'j'
+    coords: parameter name -> values
+    s: s[param0, param1, ..., f, i(, j)]
+    """
+    def __init__(self, coords, f, s, all_ports):
+        self.coords = coords
+        self.f = f
+        self.s = s
+        self.dims = list(coords) + ['f', 'i'] + (['j'] if all_ports else [])
+
+    def sel(self, **params):
+        """ select by parameter value, e.g. r.sel(etch=10e-6) """
+        index = []
+        for name in self.coords:
+            if name in params:
+                index.append(list(self.coords[name]).index(params[name]))
+            else:
+                index.append(slice(None))
+        return self.s[tuple(index)]
+
+def _cells(builder, params):
+    return builder(**params).mesh_report(1).total_cells
+
+def sweep(builder, grid, z=50, numThreads=None, nprocesses=None, all_ports=False):
+    """
+    Solve builder(**params) for every point in grid.
+    builder: callable returning an OpenEMS instance with the scene built
+    grid: dict of parameter name -> sequence of values, swept as an outer product
+    numThreads: solver threads per job (split over the excitations with all_ports)
+    nprocesses: concurrent jobs, default enough to fill the cores
+    without numThreads both are packed for the mesh of the first point using
+    the host profile, see calibrate.pack()
+    """
+    coords = {name: list(values) for name, values in grid.items()}
+    points = list(itertools.product(*coords.values()))
+    if numThreads is None:
+        first = dict(zip(coords, points[0]))
+        cells = fork_map(lambda params: _cells(builder, params), [first], 1)[0]
+        numThreads, packed = calibrate.pack(cells, len(points))
+        nprocesses = nprocesses or packed
+    if nprocesses is None:
+        nprocesses = max(1, (os.cpu_count() or 1) // numThreads)
+    nprocesses = min(nprocesses, len(points))
+    available = estimate.available_memory()
+    jobs = [(builder, i, dict(zip(coords, p)), z, numThreads, all_ports, nprocesses, available)
+            for i, p in enumerate(points)]
+    results = fork_map(lambda job: _run_point(*job), jobs, nprocesses)
+    f = results[0][0]
+    for r in results:
+        if len(r[0]) != len(f) or np.any(r[0] != f):
+            raise Exception("sweep points must share a frequency list")
+    shape = tuple(len(v) for v in coords.values())
+    s = np.stack([r[1] for r in results]).reshape(shape + results[0][1].shape)
+    return SweepResult(coords, f, s, all_ports)
+
+def _export_point(builder, index, params, directory, pattern, mirrors, previous):
+    em = builder(**params)
+    base = pattern.format(name=os.path.basename(em.name), index=index, **params)
+    parts = [base + ('_' + m if m else '') for m in mirrors]
+    files = [part + '.kicad_mod' for part in parts]
+    h = kicadfpwriter.geometry_hash(em.objects.values())
+    written = previous.get(tuple(files)) != h or not all(os.path.exists(os.path.join(directory, fn)) for fn in files)
+    if written:
+        kicadfpwriter.write(em.objects.values(),
+                            [(os.path.join(directory, fn), part, m) for (fn, part, m) in zip(files, parts, mirrors)])
+    return {'params': params, 'hash': h, 'files': files, 'written': written}
+
+def export_kicad(builder, grid, directory='.', pattern='{name}_{index}', mirrors=None, nprocesses=None,
+                 manifest='manifest.json'):
+    """
+    Write the KiCad footprint of builder(**params) for every point in grid
+    without solving, in parallel processes.
+    pattern: footprint name, formatted with name (em.name), index and the parameters
+    mirrors: a footprint for each, with _<mirror> appended to the name if not '', default ['']
+    A point is not rewritten if its files exist and the geometry hash recorded for
+    them in the manifest (directory/manifest) is unchanged.
+    returns the manifest: {'parameters': names, 'variants': [{params, hash, files, written}]}
+    """
+    if mirrors is None:
+        mirrors = ['']
+    coords = {name: list(values) for name, values in grid.items()}
+    points = list(itertools.product(*coords.values()))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, manifest)
+    try:
+        with open(path) as f:
+            previous = {tuple(v['files']): v['hash'] for v in json.load(f)['variants']}
+    except (OSError, ValueError, KeyError):
+        previous = {}
+    jobs = [(builder, i, dict(zip(coords, p)), directory, pattern, mirrors, previous) for i, p in enumerate(points)]
+    variants = fork_map(lambda job: _export_point(*job), jobs, nprocesses)
+    rv = {'parameters': list(coords), 'variants': variants}
+    with open(path, 'w') as f:
+        json.dump(rv, f, indent=1, default=float)
+    return rv
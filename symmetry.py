@@ -0,0 +1,202 @@
+import itertools
+import numpy as np
+
+axes = {'x': 0, 'y': 1}
+
+def mirror_vector(planes):
+    """ [-1 or 1] * 3 mirroring about each of planes, 'x' is the plane x = 0 """
+    m = np.ones(3)
+    for p in planes:
+        m[axes[p]] = -1
+    return m
+
+def key(o, m, tolerance=1e-9):
+    """ hashable description of object o mirrored by m """
+    def r(a):
+        return tuple(np.round(np.asarray(a, dtype=float) / tolerance).astype(np.int64).ravel())
+    material = getattr(getattr(o, 'material', None), 'name', None)
+    head = (type(o).__name__, material, getattr(o, 'priority', None), getattr(o, 'direction', None))
+    if hasattr(o, 'points'): # Polygon
+        i = {'x': [1, 2], 'y': [0, 2], 'z': [0, 1]}[o.normal_direction]
+        return head + (frozenset(r(p) for p in o.points * m[i]), r(sorted(o.elevation)))
+    if hasattr(o, 'x') and hasattr(o, 'y'): # Via, RoundPad
+        radii = [getattr(o, a, 0) for a in ['drillradius', 'wall_thickness', 'padradius']]
+        return head + (r([o.x * m[0], o.y * m[1]]), r(o.z), r(radii))
+    if hasattr(o, 'start'): # Box, Cylinder, Port
+        start = np.asarray(o.start) * m
+        stop = np.asarray(o.stop) * m
+        return head + (r(np.minimum(start, stop)), r(np.maximum(start, stop)),
+                       r(getattr(o, 'radius', 0)), r(getattr(o, 'z', 0)))
+    return head + (id(o),) # unknown objects are never symmetric
+
+def keys(em, m):
+    rv = {}
+    for o in em.objects.values():
+        k = key(o, m)
+        rv[k] = rv.get(k, 0) + 1
+    return rv
+
+def crosses(port, plane):
+    a = axes[plane]
+    return min(port.start[a], port.stop[a]) < 0 < max(port.start[a], port.stop[a])
+
+def detect(em, crossing=False):
+    """
+    the planes among 'x' and 'y' about which the objects of em are mirror
+    symmetric and, unless crossing, which no port crosses
+    """
+    identity = keys(em, mirror_vector(''))
+    return ''.join(p for p in 'xy' if keys(em, mirror_vector(p)) == identity
+                   and (crossing or not any(crosses(port, p) for port in em.ports)))
+
+def group(planes):
+    """ every combination of mirrors about planes, as strings """
+    return [''.join(g) for n in range(len(planes) + 1) for g in itertools.combinations(planes, n)]
+
+def port_orbits(em, planes):
+    """
+    Split the ports into representatives on the positive side of each plane
+    and their images. returns (representatives, images) where images[g][i] =
+    (index in em.ports, polarity) of the image of representative i mirrored by g.
+    Polarity is -1 where the image port's direction is reversed from the mirror.
+    """
+    for p in em.ports:
+        for plane in planes:
+            if crosses(p, plane):
+                raise Exception("port {} crosses the {} symmetry plane".format(p.portnumber, plane))
+    reps = [p for p in em.ports if all(min(p.start[axes[q]], p.stop[axes[q]]) >= 0 for q in planes)]
+    lookup = {key(p, np.ones(3)): i for (i, p) in enumerate(em.ports)}
+    images = {}
+    used = set()
+    for g in group(planes):
+        m = mirror_vector(g)
+        images[g] = []
+        for p in reps:
+            i = lookup.get(key(p, m))
+            if i is None:
+                raise Exception("port {} has no image in {}".format(p.portnumber, g))
+            q = em.ports[i]
+            d = 'xyz'.index(p.direction[-1])
+            polarity = np.sign(m[d] * (p.stop[d] - p.start[d])) * np.sign(q.stop[d] - q.start[d])
+            images[g].append((i, polarity))
+            used.add(i)
+    if len(used) != len(em.ports):
+        raise Exception("ports are not symmetric about {}".format(planes))
+    return reps, images
+
+def boundaries(em, planes, mode):
+    """ boundaries with the lower wall of each plane PMC for even (+1) or PEC for odd (-1) mode """
+    bc = list(em.boundaries)
+    for (plane, chi) in zip(planes, mode):
+        bc[2 * axes[plane]] = 'PMC' if chi > 0 else 'PEC'
+    return bc
+
+def clip_half(lines):
+    """ lines >= 0 with a line at 0, dropping a line that would leave a sliver cell at 0 """
+    lines = np.unique(np.concatenate(([0.0], lines[lines > 0])))
+    if len(lines) > 2 and lines[1] < 0.5 * (lines[2] - lines[1]):
+        lines = np.delete(lines, 1)
+    return lines
+
+def reconstruct(planes, modes, s, images, nports):
+    """
+    Full s[f, i, j] from the reduced solves
+    s: {mode: s[f, i, j]} over the representatives for each mode
+    """
+    def character(mode, g):
+        return np.prod([chi for (plane, chi) in zip(planes, mode) if plane in g])
+    nf = len(next(iter(s.values())))
+    rv = np.zeros((nf, nports, nports), dtype=complex)
+    for g in images:
+        for h in images:
+            for (i, (pi, poli)) in enumerate(images[g]):
+                for (j, (pj, polj)) in enumerate(images[h]):
+                    rv[:, pi, pj] = poli * polj * sum(
+                        character(mode, g) * character(mode, h) * s[mode][:, i, j] for mode in modes) / len(modes)
+    return rv
+
+def port_permutations(em, planes):
+    """
+    [(perm, polarity)] for each mirror in group(planes) that maps the ports
+    onto each other: port i is mapped to port perm[i] with polarity[i]
+    """
+    lookup = {key(p, np.ones(3)): i for (i, p) in enumerate(em.ports)}
+    rv = []
+    for g in group(planes):
+        m = mirror_vector(g)
+        perm = [lookup.get(key(p, m)) for p in em.ports]
+        if None in perm:
+            continue
+        polarity = []
+        for (p, i) in zip(em.ports, perm):
+            d = 'xyz'.index(p.direction[-1])
+            q = em.ports[i]
+            polarity.append(np.sign(m[d] * (p.stop[d] - p.start[d])) * np.sign(q.stop[d] - q.start[d]))
+        rv.append((np.array(perm), np.array(polarity)))
+    return rv
+
+def closure(perms, nports):
+    """ the group generated by perms [(perm, polarity)], including the identity """
+    rv = {}
+    new = [(np.arange(nports), np.ones(nports))] + list(perms)
+    while new:
+        a = new.pop()
+        k = (tuple(a[0]), tuple(a[1]))
+        if k in rv:
+            continue
+        rv[k] = a
+        for b in list(rv.values()): # a after b and b after a
+            new.append((a[0][b[0]], b[1] * a[1][b[0]]))
+            new.append((b[0][a[0]], a[1] * b[1][a[0]]))
+    return list(rv.values())
+
+def permutations(em, declared='auto'):
+    """
+    port symmetries of em, the mirrors detected from the geometry for 'auto'
+    or the group generated by declared, a list of port index permutations
+    such as [[1, 0, 3, 2]]
+    """
+    nports = len(em.ports)
+    if isinstance(declared, str):
+        perms = port_permutations(em, detect(em, crossing=True))
+    else:
+        perms = [(np.array(d), np.ones(nports)) for d in declared]
+    return closure(perms, nports)
+
+def covered(perms, k, nports, reciprocal=True):
+    """ the entries (i, j) of s[f, i, j] known from exciting port k """
+    rv = set()
+    for (p, pol) in perms:
+        for i in range(nports):
+            rv.add((p[i], p[k]))
+            if reciprocal:
+                rv.add((p[k], p[i]))
+    return rv
+
+def plan(perms, nports, reciprocal=True):
+    """ the fewest ports to excite to fill the S matrix, sorted """
+    need = set(itertools.product(range(nports), repeat=2))
+    cover = [covered(perms, k, nports, reciprocal) for k in range(nports)]
+    for n in range(1, nports + 1):
+        for excite in itertools.combinations(range(nports), n):
+            if need <= set().union(*[cover[k] for k in excite]):
+                return list(excite)
+    return list(range(nports))
+
+def fill(columns, perms, nports, reciprocal=True):
+    """
+    Full s[f, i, j] from columns {k: s[f, i]} solved with port k excited
+    using the port symmetries perms and optionally reciprocity.
+    """
+    nf = len(next(iter(columns.values())))
+    rv = np.full((nf, nports, nports), np.nan, dtype=complex)
+    for (k, s) in columns.items():
+        for (p, pol) in perms:
+            rv[:, p, p[k]] = s * pol * pol[k]
+            if reciprocal:
+                rv[:, p[k], p] = s * pol * pol[k]
+    for (k, s) in columns.items(): # solved columns over their images
+        rv[:, :, k] = s
+    if np.isnan(rv).any():
+        raise Exception("ports {} do not determine the S matrix".format(sorted(columns)))
+    return rv
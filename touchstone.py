@@ -0,0 +1,79 @@
+import numpy as np
+
+funits = {'Hz': 1.0, 'kHz': 1e3, 'MHz': 1e6, 'GHz': 1e9}
+
+# printf format of one value pair for each data format
+pair_formats = {
+    'DB': '%12.6f %12.6f',
+    'MA': '%.9e %12.6f',
+    'RI': '%.9e %.9e',
+}
+
+def pairs(s, fmt):
+    """ s[..] complex -> [.., 2] of the value pairs for fmt """
+    if fmt == 'RI':
+        return np.stack((s.real, s.imag), axis=-1)
+    angle = np.degrees(np.angle(s))
+    mag = np.abs(s)
+    if fmt == 'DB':
+        with np.errstate(divide='ignore'):
+            mag = 20.0 * np.log10(mag)
+    return np.stack((mag, angle), axis=-1)
+
+def record_format(nports, fmt):
+    """
+    printf format of one frequency record: 2 ports on one line in column major
+    order, otherwise one matrix row per line, at most 4 pairs per line
+    """
+    rows = [nports * nports] if nports < 3 else [nports] * nports
+    lines = []
+    for n in rows:
+        for k in range(0, n, 4):
+            lines.append(" ".join([pair_formats[fmt]] * min(4, n - k)))
+    return "%12.6f " + ("\n" + " " * 13).join(lines)
+
+def write_touchstone(filename, f, s, z0=50, fmt='DB', version=1, funit='GHz', chunk=4096):
+    """
+    Write an N port Touchstone file
+    filename: path or an open text file
+    f: frequencies, Hz
+    s: s[f, i, j], or s[f] for a 1 port
+    z0: reference impedance, or one per port (requires version 2)
+    fmt: 'DB', 'MA' or 'RI'
+    version: 1 or 2
+    chunk: frequencies formatted per write
+    """
+    s = np.asarray(s)
+    if s.ndim == 1:
+        s = s.reshape(-1, 1, 1)
+    nports = s.shape[1]
+    z0 = np.broadcast_to(np.asarray(z0, dtype=float), (nports,))
+    if version == 1 and np.any(z0 != z0[0]):
+        raise Exception("per port reference impedances need Touchstone version 2")
+    header = "# {} S {} R {:g}\n".format(funit, fmt, z0[0])
+    if version == 2:
+        header = "[Version] 2.0\n" + header
+        header += "[Number of Ports] {}\n".format(nports)
+        if nports == 2:
+            header += "[Two-Port Data Order] 21_12\n"
+        header += "[Number of Frequencies] {}\n".format(len(f))
+        header += "[Reference] {}\n".format(" ".join("{:g}".format(z) for z in z0))
+        header += "[Network Data]\n"
+    record = record_format(nports, fmt)
+    # 2 ports are column major, s11 s21 s12 s22
+    order = s.transpose(0, 2, 1) if nports == 2 else s
+    if isinstance(filename, str):
+        fh = open(filename, "w")
+    else:
+        fh = filename
+    try:
+        fh.write(header)
+        for k in range(0, len(f), chunk):
+            values = pairs(order[k:k+chunk], fmt).reshape(len(order[k:k+chunk]), -1)
+            data = np.column_stack((np.asarray(f[k:k+chunk]) / funits[funit], values))
+            np.savetxt(fh, data, fmt=record)
+        if version == 2:
+            fh.write("[End]\n")
+    finally:
+        if fh is not filename:
+            fh.close()